@@ -0,0 +1,66 @@
+"""
+Encode speed, decode speed and file size of the intermediate formats a
+rendered overlay animation can be written in (video_encoder.ANIMATION_FORMATS).
+
+Frames are rendered once up front, so encode fps is ffmpeg's alone; decode
+fps is a full decode to raw RGBA, as moviepy does when compositing.
+
+Run from the repository root:  python -m benchmarks.bench_formats
+"""
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+
+from src import gpx_renderer, video_encoder
+from src.gpx_resampler import TrackResampler, epoch_seconds
+from .synthetic import synthetic_track
+
+STYLE = dict(bg_color='None', bg_alpha=0, main_line_color='black', bg_line_color='lightgray', line_width=2)
+
+
+def decode_fps(path, frames) -> float:
+    command = [video_encoder.ffmpeg_binary(), '-loglevel', 'error', '-i', path,
+               '-f', 'rawvideo', '-pix_fmt', 'rgba', '-']
+    start = time.perf_counter()
+    subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+    return frames / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--points', type=int, default=600, help="recorded points at 1 Hz")
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--frames', type=int, default=150, help="frames encoded per format")
+    parser.add_argument('--dpi', type=int, default=150, help="10x6 inch overlay, 1500x900 pixels at 150")
+    parser.add_argument('--formats', nargs='+', choices=list(video_encoder.ANIMATION_FORMATS),
+                        default=list(video_encoder.ANIMATION_FORMATS))
+    args = parser.parse_args()
+
+    track = synthetic_track(args.points)
+    resampler = TrackResampler(epoch_seconds(track['time']), track['latitude'], track['longitude'],
+                               fps=args.fps)
+    renderer = gpx_renderer.RasterTrackRenderer(resampler, **STYLE, dpi=args.dpi)
+    frames = [frame.copy() for frame in gpx_renderer.iter_frames(renderer, 0, args.frames)]
+    height, width = frames[0].shape[:2]
+
+    print(f"{width}x{height}, {len(frames)} frames")
+    print(f"{'format':>8} {'alpha':>6} {'encode fps':>11} {'decode fps':>11} {'MB':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.formats:
+            extension, output_args, with_alpha = video_encoder.animation_format(name)
+            path = os.path.join(directory, name + extension)
+            start = time.perf_counter()
+            video_encoder.encode_frames(iter(frames), path, args.fps, with_alpha=with_alpha,
+                                        output_args=output_args)
+            encode = len(frames) / (time.perf_counter() - start)
+            print(f"{name:>8} {'yes' if with_alpha else 'no':>6} {encode:>11.1f} "
+                  f"{decode_fps(path, len(frames)):>11.1f} {os.path.getsize(path) / 2**20:>8.2f}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Vectorised bearings against the per-row ``calculate_bearing`` loop.
+
+Run from the repository root:  python -m benchmarks.bench_kinematics
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src import gpx_kinematics
+from src.gpx_utils import calculate_bearing
+from .synthetic import synthetic_track
+
+
+def scalar_bearings(latitudes, longitudes) -> np.ndarray:
+    """The original ``calculate_bearings`` loop, minus the DataFrame indexing."""
+    bearings = [calculate_bearing(latitudes[i - 1], longitudes[i - 1], latitudes[i], longitudes[i])
+                for i in range(1, len(latitudes))]
+    return np.array([bearings[0]] + bearings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--points', type=int, nargs='+', default=[10_000, 108_000])
+    args = parser.parse_args()
+
+    print(f"{'points':>10} {'scalar ms':>10} {'vectorised ms':>14} {'max |diff| deg':>15}")
+    for num_points in args.points:
+        track = synthetic_track(num_points)
+        lat, lon = track['latitude'], track['longitude']
+
+        start = time.perf_counter()
+        reference = scalar_bearings(lat, lon)
+        scalar = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = gpx_kinematics.kinematics(lat, lon, track['elevation'])['bearing']
+        vectorised = time.perf_counter() - start
+
+        # Compare on the circle so 359.999 vs 0.0 is not reported as a mismatch
+        diff = np.abs((result - reference + 180) % 360 - 180).max()
+        assert diff < 1e-9, f"vectorised bearings drift from calculate_bearing by {diff}"
+        print(f"{num_points:>10} {scalar * 1e3:>10.1f} {vectorised * 1e3:>14.2f} {diff:>15.2e}")
+
+
+if __name__ == '__main__':
+    main()
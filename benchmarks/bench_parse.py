@@ -0,0 +1,58 @@
+"""
+Throughput of the streaming GPX parser against the gpxpy object-tree path.
+
+Run from the repository root:  python -m benchmarks.bench_parse
+"""
+import argparse
+import time
+
+import gpxpy
+import pandas as pd
+
+from src import gpx_utils
+from .synthetic import synthetic_gpx
+
+
+def parse_gpx_gpxpy(gpx_file) -> pd.DataFrame:
+    """The original ``parse_gpx``: gpxpy tree -> list of dicts -> DataFrame."""
+    gpx = gpxpy.parse(gpx_file)
+    points = []
+    for track in gpx.tracks:
+        for segment in track.segments:
+            for point in segment.points:
+                points.append({
+                    'latitude': point.latitude,
+                    'longitude': point.longitude,
+                    'elevation': point.elevation,
+                    'time': point.time,
+                    'speed': point.speed if point.speed is not None else 0
+                })
+    return pd.DataFrame(points)
+
+
+def best_of(func, arg, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--points', type=int, nargs='+', default=[3_600, 36_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'points':>10} {'gpxpy pts/s':>14} {'streaming pts/s':>16} {'speedup':>8}")
+    for num_points in args.points:
+        xml = synthetic_gpx(num_points)
+        legacy = best_of(parse_gpx_gpxpy, xml, args.repeat)
+        streaming = best_of(gpx_utils.parse_gpx, xml, args.repeat)
+        print(f"{num_points:>10} {num_points / legacy:>14,.0f} {num_points / streaming:>16,.0f} "
+              f"{legacy / streaming:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Frames/sec of the full-redraw matplotlib track renderer against the
+incremental raster renderer, sampled early and late in the track, and of
+the matplotlib compass against the pre-rendered compass strip.
+
+Run from the repository root:  python -m benchmarks.bench_render
+"""
+import argparse
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from src import gpx_renderer
+from src.gpx_resampler import TrackResampler, epoch_seconds
+from .synthetic import synthetic_track
+
+STYLE = dict(bg_color='white', bg_alpha=1, main_line_color='black', bg_line_color='lightgray', line_width=2)
+COMPASS_STYLE = dict(bg_color='white', bg_alpha=1, heading_color='red', line_width=10, axis_thickness=10,
+                     axis_fontsize=10)
+
+
+def matplotlib_fps(resampler, frames) -> float:
+    fig, _, line = gpx_renderer.track_figure(resampler, **STYLE)
+    start = time.perf_counter()
+    for frame in frames:
+        latitudes, longitudes = resampler.trail(frame)
+        line.set_data(longitudes, latitudes)
+        gpx_renderer.canvas_rgba(fig)
+    elapsed = time.perf_counter() - start
+    plt.close(fig)
+    return len(frames) / elapsed
+
+
+def raster_fps(resampler, frames) -> float:
+    renderer = gpx_renderer.RasterTrackRenderer(resampler, **STYLE)
+    renderer.advance(frames[0] - 1)  # bring the buffer up to the sampled window untimed
+    start = time.perf_counter()
+    for frame in frames:
+        renderer.render(frame)
+    return len(frames) / (time.perf_counter() - start)
+
+
+def renderer_fps(renderer, frames) -> float:
+    start = time.perf_counter()
+    for frame in frames:
+        renderer.render(frame)
+    elapsed = time.perf_counter() - start
+    renderer.close()
+    return len(frames) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--points', type=int, default=3_600, help="recorded points at 1 Hz")
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--frames', type=int, default=60, help="frames timed per sample")
+    args = parser.parse_args()
+
+    track = synthetic_track(args.points)
+    resampler = TrackResampler(epoch_seconds(track['time']), track['latitude'], track['longitude'],
+                               fps=args.fps)
+
+    print(f"{'position':>9} {'matplotlib fps':>15} {'raster fps':>11}")
+    for fraction in (0.1, 0.5, 0.9):
+        first = int(resampler.num_frames * fraction)
+        frames = list(range(first, first + args.frames))
+        print(f"{fraction:>9.0%} {matplotlib_fps(resampler, frames):>15.1f} "
+              f"{raster_fps(resampler, frames):>11.1f}")
+
+    frames = list(range(args.frames))
+    print(f"\n{'compass':>9} {'matplotlib fps':>15} {'strip fps':>11}")
+    print(f"{'':>9} {renderer_fps(gpx_renderer.MatplotlibCompassRenderer(resampler, **COMPASS_STYLE), frames):>15.1f} "
+          f"{renderer_fps(gpx_renderer.CompassStripRenderer(resampler, **COMPASS_STYLE), frames):>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
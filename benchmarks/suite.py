@@ -0,0 +1,262 @@
+"""
+Stage-by-stage benchmark of the pipeline on synthetic fixtures, with a
+regression check against a stored baseline.
+
+Generates a GPX track and a base video in a temporary directory, then runs
+each stage in a fresh process so its peak memory (max RSS of the process,
+and separately of the ffmpeg children it ran) is its own. Throughput is in
+the stage's natural unit (points, crops or frames per second).
+
+Run from the repository root:
+    python -m benchmarks.suite                      # report only
+    python -m benchmarks.suite --check              # exit 1 on regressions
+    python -m benchmarks.suite --update-baseline    # store this run as the baseline
+
+Baselines are machine specific; regenerate one on the host you compare on.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+
+from .synthetic import synthetic_gpx, synthetic_video
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+ANIMATION_STYLES = ('Matplotlib Animation', 'Matplotlib Moviepy', 'Incremental Raster')
+STYLE = dict(bg_color='white', bg_alpha=1, main_line_color='black', bg_line_color='lightgray',
+             gpx_map_line_width=2)
+OVERLAY_SIZE = (400, 240)
+# Fixture settings a baseline is only comparable under
+BASELINE_SETTINGS = ('points', 'sample_rate', 'fps', 'animation_seconds', 'video_seconds', 'video_size')
+
+
+def _no_progress(text):
+    return lambda fraction: None
+
+
+def _load_track(fixtures, seconds=None):
+    from src import gpx_utils, gpx_track
+    track = gpx_track.Track(gpx_utils.parse_gpx(fixtures['gpx']))
+    return track if seconds is None else track.crop_seconds(0, seconds)
+
+
+def _fastest(func, min_seconds: float = 0.5) -> float:
+    """
+    Seconds of the fastest of repeated calls to ``func``, made for at least
+    ``min_seconds``; for stages too quick to time reliably in a single call.
+    """
+    fastest, deadline = np.inf, time.perf_counter() + min_seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        func()
+        fastest = min(fastest, time.perf_counter() - start)
+    return fastest
+
+
+# Each stage takes the fixtures and returns (work units done, unit, seconds timed)
+
+def stage_parse_gpx(fixtures, args):
+    from src import gpx_utils
+    return args.points, 'points', _fastest(lambda: gpx_utils.parse_gpx(fixtures['gpx']))
+
+
+def stage_crop(fixtures, args):
+    track = _load_track(fixtures)
+    rng = np.random.default_rng(0)
+    offsets = rng.uniform(0, track.duration_seconds / 2, size=(1000, 2))
+    seconds = _fastest(lambda: [track.crop_seconds(begin, begin + length) for begin, length in offsets])
+    return len(offsets), 'crops', seconds
+
+
+def stage_calculate_bearings(fixtures, args):
+    from src import gpx_utils
+    df = _load_track(fixtures).df.copy()
+    return len(df), 'points', _fastest(lambda: gpx_utils.calculate_bearings(df))
+
+
+def stage_resample(fixtures, args):
+    from src import gpx_resampler
+    df = _load_track(fixtures).df
+    start = time.perf_counter()
+    resampler = gpx_resampler.TrackResampler(gpx_resampler.epoch_seconds(df['time']),
+                                             df['latitude'].values, df['longitude'].values, fps=args.fps)
+    for _ in resampler.iter_chunks():
+        pass
+    return resampler.num_frames, 'frames', time.perf_counter() - start
+
+
+def _stage_animate(style):
+    def stage(fixtures, args):
+        from src import gpx_utils
+        df = _load_track(fixtures, args.animation_seconds).df
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            gpx_utils.gpx_animation(df, fps=args.fps, filename=os.path.join(directory, 'animation'),
+                                    animation_style=style, progress=_no_progress, **STYLE)
+            elapsed = time.perf_counter() - start
+        return int(args.fps * (df['time'].iloc[-1] - df['time'].iloc[0]).total_seconds()), 'frames', elapsed
+    return stage
+
+
+def _overlay_frame(fixtures, args):
+    from src import gpx_renderer, gpx_resampler
+    df = _load_track(fixtures, args.animation_seconds).df
+    resampler = gpx_resampler.TrackResampler(gpx_resampler.epoch_seconds(df['time']), df['latitude'].values,
+                                             df['longitude'].values, fps=args.fps)
+    renderer = gpx_renderer.RasterTrackRenderer(resampler, 'None', 1, 'black', 'lightgray', 2,
+                                                figsize=(OVERLAY_SIZE[0] / 40, OVERLAY_SIZE[1] / 40), dpi=40)
+    return renderer.render(resampler.num_frames - 1)
+
+
+def stage_composite(fixtures, args):
+    from src import video_utils
+    base = video_utils.read_frame(fixtures['video'], 1.0)
+    overlay = _overlay_frame(fixtures, args)
+    pos = video_utils.overlay_position('Bottom-Right', base.shape[1::-1], overlay.shape[1::-1])
+    frames = args.fps * 5
+    start = time.perf_counter()
+    for _ in range(frames):
+        video_utils.composite_frame(base, overlay, pos, 0.8, False, False)
+    return frames, 'frames', time.perf_counter() - start
+
+
+def stage_encode(fixtures, args):
+    from src import video_utils, video_encoder
+    base = video_utils.read_frame(fixtures['video'], 1.0)
+    frames = args.fps * 5
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        video_encoder.encode_frames((base for _ in range(frames)), os.path.join(directory, 'out.mp4'), args.fps)
+        elapsed = time.perf_counter() - start
+    return frames, 'frames', elapsed
+
+
+def stage_overlay_videos(fixtures, args):
+    from src import video_utils
+    info = video_utils.video_info(fixtures['video'])
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        video_utils.overlay_videos(fixtures['video'], fixtures['animation'], 'Bottom-Right',
+                                   os.path.join(directory, 'overlay.mp4'), OVERLAY_SIZE[1], OVERLAY_SIZE[0],
+                                   0.8, False, False)
+        elapsed = time.perf_counter() - start
+    return info['video_nframes'], 'frames', elapsed
+
+
+STAGES = {
+    'parse_gpx': stage_parse_gpx,
+    'crop': stage_crop,
+    'calculate_bearings': stage_calculate_bearings,
+    'resample': stage_resample,
+    **{f'animate[{style}]': _stage_animate(style) for style in ANIMATION_STYLES},
+    'composite': stage_composite,
+    'encode': stage_encode,
+    'overlay_videos': stage_overlay_videos,
+}
+
+
+def _run_stage(name, fixtures, args):
+    import contextlib
+    # moviepy and ffmpeg chatter would drown the report
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        units, unit, seconds = STAGES[name](fixtures, args)
+    kilobytes = 1024 if sys.platform == 'darwin' else 1  # ru_maxrss is bytes on macOS
+    return {
+        'throughput': units / seconds, 'unit': f'{unit}/s', 'seconds': seconds,
+        'peak_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 / kilobytes,
+        'child_peak_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024 / kilobytes,
+    }
+
+
+def make_fixtures(directory, args) -> dict:
+    from src import gpx_utils
+    fixtures = {'gpx': os.path.join(directory, 'track.gpx'), 'video': os.path.join(directory, 'base.mp4')}
+    with open(fixtures['gpx'], 'w') as f:
+        f.write(synthetic_gpx(args.points, args.sample_rate))
+    synthetic_video(fixtures['video'], args.video_seconds, tuple(args.video_size), args.fps)
+    # The overlay stage composites a pre-rendered animation of the video's length
+    track = _load_track(fixtures, args.video_seconds)
+    gpx_utils.gpx_animation(track.df, fps=args.fps, filename=os.path.join(directory, 'animation'),
+                            animation_style='Incremental Raster', progress=_no_progress, **STYLE)
+    fixtures['animation'] = os.path.join(directory, 'animation.mov')
+    return fixtures
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Stages slower, or using more memory, than the baseline allows."""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if result['throughput'] < reference['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: {result['throughput']:,.1f} {result['unit']} "
+                               f"< baseline {reference['throughput']:,.1f}")
+        if result['peak_mb'] > reference['peak_mb'] * (1 + tolerance):
+            regressions.append(f"{name}: peak {result['peak_mb']:,.0f} MB > baseline {reference['peak_mb']:,.0f} MB")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--points', type=int, default=36_000, help="recorded GPX points")
+    parser.add_argument('--sample-rate', type=float, default=1.0, help="GPX points per second")
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--animation-seconds', type=float, default=10, help="track length animated per style")
+    parser.add_argument('--video-seconds', type=float, default=10)
+    parser.add_argument('--video-size', type=int, nargs=2, default=[1280, 720])
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.4,
+                        help="allowed fractional slowdown / memory growth before --check fails")
+    parser.add_argument('--check', action='store_true', help="exit 1 if any stage regressed against the baseline")
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args(argv)
+
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        fixtures = make_fixtures(directory, args)
+        print(f"{'stage':<34} {'throughput':>22} {'seconds':>8} {'peak MB':>8} {'ffmpeg MB':>9}")
+        for name in args.stages:
+            # A fresh process per stage, so peak memory is not inherited from earlier stages
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(_run_stage, name, fixtures, args).result()
+            results[name] = result
+            print(f"{name:<34} {result['throughput']:>14,.1f} {result['unit']:<7} {result['seconds']:>8.2f} "
+                  f"{result['peak_mb']:>8.0f} {result['child_peak_mb']:>9.0f}", flush=True)
+
+    settings = {name: getattr(args, name) for name in BASELINE_SETTINGS}
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'settings': settings, 'stages': results}, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    if args.check:
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline}; run with --update-baseline first", file=sys.stderr)
+            return 1
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['settings'] != settings:
+            print(f"Baseline was recorded with {baseline['settings']}, not {settings}", file=sys.stderr)
+            return 1
+        regressions = compare(results, baseline['stages'], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print("No regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
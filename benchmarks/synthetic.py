@@ -0,0 +1,59 @@
+"""
+Synthetic fixtures for the benchmarks.
+"""
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from src import video_encoder
+
+GPX_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<gpx version="1.1" creator="gpx_overlay benchmarks" '
+    'xmlns="http://www.topografix.com/GPX/1/1" '
+    'xmlns:gpxtpx="http://www.garmin.com/xmlschemas/TrackPointExtension/v2">\n'
+)
+
+
+def synthetic_track(num_points: int, sample_rate: float = 1.0, seed: int = 0) -> dict:
+    """Random-walk ride starting in central London, sampled at ``sample_rate`` Hz."""
+    rng = np.random.default_rng(seed)
+    heading = np.cumsum(rng.normal(0, 0.1, num_points))
+    step = rng.uniform(2, 8, num_points) / sample_rate  # metres per sample
+    latitudes = 51.5 + np.cumsum(step * np.cos(heading)) / 111_320
+    longitudes = -0.12 + np.cumsum(step * np.sin(heading)) / (111_320 * np.cos(np.radians(51.5)))
+    elevations = 30 + np.cumsum(rng.normal(0, 0.2, num_points))
+    start = datetime(2024, 6, 1, 8, 0, tzinfo=timezone.utc)
+    times = [start + timedelta(seconds=i / sample_rate) for i in range(num_points)]
+    return {'latitude': latitudes, 'longitude': longitudes, 'elevation': elevations,
+            'time': times, 'speed': step * sample_rate}
+
+
+def synthetic_gpx(num_points: int, sample_rate: float = 1.0, seed: int = 0) -> str:
+    """GPX 1.1 document with elevation, time and a speed extension per point."""
+    track = synthetic_track(num_points, sample_rate, seed)
+    parts = [GPX_HEADER, '<trk><trkseg>\n']
+    for lat, lon, ele, time, speed in zip(track['latitude'], track['longitude'], track['elevation'],
+                                          track['time'], track['speed']):
+        parts.append(
+            f'<trkpt lat="{lat:.7f}" lon="{lon:.7f}"><ele>{ele:.1f}</ele>'
+            f'<time>{time.strftime("%Y-%m-%dT%H:%M:%S.%fZ")}</time>'
+            f'<extensions><gpxtpx:TrackPointExtension><gpxtpx:speed>{speed:.2f}</gpxtpx:speed>'
+            f'</gpxtpx:TrackPointExtension></extensions></trkpt>\n'
+        )
+    parts.append('</trkseg></trk></gpx>\n')
+    return ''.join(parts)
+
+
+def synthetic_video(path: str, duration: float = 10, size: tuple = (1280, 720), fps: float = 30,
+                    audio: bool = True) -> str:
+    """Moving ffmpeg test pattern (with a sine tone) encoded as H.264, like a camera clip."""
+    width, height = size
+    command = [video_encoder.ffmpeg_binary(), '-y', '-loglevel', 'error',
+               '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate={fps}:duration={duration}']
+    if audio:
+        command += ['-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}', '-c:a', 'aac']
+    command += ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-g', str(int(fps)), path]
+    subprocess.run(command, check=True, capture_output=True)
+    return path
@@ -0,0 +1,278 @@
+"""
+Headless batch runner: parse -> crop -> animate -> overlay for many GPX/video pairs.
+
+    python -m src.batch jobs.json --output-dir batch_output --workers 4
+    python -m src.batch rides/ --output-dir batch_output
+
+A manifest is JSON with optional ``defaults`` and a list of ``jobs``; a
+directory pairs every ``.gpx`` file with the video of the same name. Paths
+in a manifest are relative to it. Job settings (all optional except the
+paths)::
+
+    {"name": "ride1", "gpx": "ride1.gpx", "video": "ride1.mp4",
+     "video_start": 12.5, "video_end": 95,       # seconds of the video to keep
+     "crop_mode": "exact",                       # "exact", "copy" or "reencode"
+     "gpx_start": 30,                            # seconds into the track at video_start
+     "style": {"animation_style": "Incremental Raster", "bg_color": "white", ...},
+     "overlay": {"position": "Bottom-Right", "width": 500, "height": 300,
+                 "transparency": 1.0, "gray_box": false, "invert_colors": false,
+                 "workers": 4}}                   # processes compositing segments, default 1
+
+Each job runs in its own process and writes into ``<output-dir>/<name>/``:
+``job.log``, ``metrics.json`` with the stage timings and counters of the last
+run, and ``status.json``, which records the finished stages. Running
+the same manifest again skips finished jobs and resumes unfinished ones from
+the first stage without a recorded output; changing a job's settings starts
+it over. Streamlit is never imported.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import gpx_utils, gpx_track, video_utils, render_cache, render_pool, instrumentation
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.MP4', '.MOV')
+STAGES = ('crop', 'animate', 'overlay')
+DEFAULT_JOB = {
+    'video_start': None,
+    'video_end': None,
+    'crop_mode': 'exact',
+    'gpx_start': 0,
+    'style': {'animation_style': 'Incremental Raster'},
+    'overlay': {'position': 'Bottom-Right', 'width': 500, 'height': 300,
+                'transparency': 1.0, 'gray_box': False, 'invert_colors': False},
+}
+
+
+def _merge(defaults: dict, settings: dict) -> dict:
+    merged = dict(defaults)
+    for name, value in settings.items():
+        if isinstance(value, dict) and isinstance(merged.get(name), dict):
+            value = _merge(merged[name], value)
+        merged[name] = value
+    return merged
+
+
+def load_jobs(source: str) -> list:
+    """Job settings from a manifest file or a directory of GPX/video pairs."""
+    if os.path.isdir(source):
+        jobs = []
+        for name in sorted(os.listdir(source)):
+            stem, extension = os.path.splitext(name)
+            if extension.lower() != '.gpx':
+                continue
+            videos = [stem + ext for ext in VIDEO_EXTENSIONS if os.path.exists(os.path.join(source, stem + ext))]
+            if videos:
+                jobs.append({'name': stem, 'gpx': os.path.join(source, name),
+                             'video': os.path.join(source, videos[0])})
+        defaults = {}
+    else:
+        with open(source) as f:
+            manifest = json.load(f)
+        base = os.path.dirname(os.path.abspath(source))
+        defaults = manifest.get('defaults', {})
+        jobs = []
+        for index, job in enumerate(manifest['jobs']):
+            job = dict(job)
+            job['gpx'] = os.path.join(base, job['gpx'])
+            job['video'] = os.path.join(base, job['video'])
+            job.setdefault('name', os.path.splitext(os.path.basename(job['gpx']))[0] or f'job{index}')
+            jobs.append(job)
+
+    names = [job['name'] for job in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError("Job names must be unique")
+    return [_merge(_merge(DEFAULT_JOB, defaults), job) for job in jobs]
+
+
+def _read_status(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_status(path: str, status: dict):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(status, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def _stage_done(stage_status) -> bool:
+    return bool(stage_status) and all(os.path.exists(value) for value in stage_status.values()
+                                      if isinstance(value, str))
+
+
+def _log_progress(logger):
+    def progress(text):
+        logger.info(text)
+        last = [-1]
+
+        def update(fraction):
+            step = int(fraction * 10)
+            if step != last[0]:
+                last[0] = step
+                logger.info("  %d%%", step * 10)
+        return update
+    return progress
+
+
+def _crop(job, job_dir, logger) -> dict:
+    video = job['video']
+    info = video_utils.video_info(video)
+    start = job['video_start'] or 0.0
+    end = info['duration'] if job['video_end'] is None else job['video_end']
+    output = os.path.join(job_dir, 'cropped_video.mp4')
+    if job['video_start'] is None and job['video_end'] is None:
+        logger.info("No video crop requested, using %s", video)
+        return {'video': video, 'start': 0.0, 'end': info['duration']}
+    if job['crop_mode'] == 'reencode':
+        end = start + video_utils.crop_video(video, start, end, output)
+    else:
+        start, end = video_utils.crop_video_fast(video, start, end, output,
+                                                 exact_start=job['crop_mode'] == 'exact')
+    logger.info("Cropped video to %.3f-%.3f s", start, end)
+    return {'video': output, 'start': start, 'end': end}
+
+
+def _animate(job, job_dir, logger, cropped) -> dict:
+    track = gpx_track.Track(gpx_utils.load_gpx(job['gpx']))
+    # The track starts at gpx_start, shifted by however far the crop moved the video start
+    gpx_start = job['gpx_start'] + cropped['start'] - (job['video_start'] or 0.0)
+    duration = cropped['end'] - cropped['start']
+    track = track.crop_seconds(gpx_start, gpx_start + duration)
+    if len(track) < 2:
+        raise ValueError(f"Only {len(track)} GPX points between {gpx_start:.1f} and {gpx_start + duration:.1f} s")
+    logger.info("Cropped track to %d points", len(track))
+
+    fps = video_utils.video_info(cropped['video'])['video_fps']
+    filename = os.path.join(job_dir, 'gpx_animation')
+    gpx_utils.gpx_animation(track.df, fps=fps, filename=filename, create_compass=False,
+                            progress=_log_progress(logger), **job['style'])
+    animation = next(filename + ext for ext in ('.mov', '.gif') if os.path.exists(filename + ext))
+    return {'animation': animation}
+
+
+def _overlay(job, job_dir, logger, cropped, animated) -> dict:
+    overlay = job['overlay']
+    output = os.path.join(job_dir, job['name'] + '_overlay.mp4')
+    video_utils.overlay_videos(cropped['video'], animated['animation'], overlay['position'], output,
+                               overlay['height'], overlay['width'], overlay['transparency'],
+                               overlay['gray_box'], overlay['invert_colors'],
+                               workers=overlay.get('workers', 1))
+    return {'output': output}
+
+
+def run_job(job: dict, output_dir: str, force: bool = False) -> dict:
+    """Run (or resume) one job; returns its final status. Never raises."""
+    job_dir = os.path.join(output_dir, job['name'])
+    os.makedirs(job_dir, exist_ok=True)
+    status_path = os.path.join(job_dir, 'status.json')
+    try:
+        settings_key = render_cache.cache_key(job, render_cache.file_fingerprint(job['gpx']),
+                                              render_cache.file_fingerprint(job['video']))
+    except OSError as error:
+        status = {'name': job['name'], 'state': 'failed', 'stages': {}, 'error': f'{type(error).__name__}: {error}'}
+        _write_status(status_path, status)
+        return status
+    status = _read_status(status_path)
+    if force or status.get('settings') != settings_key:
+        status = {'name': job['name'], 'settings': settings_key, 'stages': {}}
+    if status.get('state') == 'done' and all(_stage_done(status['stages'].get(stage)) for stage in STAGES):
+        return status
+
+    logger = logging.getLogger(f'batch.{job["name"]}')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = logging.FileHandler(os.path.join(job_dir, 'job.log'))
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    logger.addHandler(handler)
+
+    stages = status['stages']
+    status['state'] = 'running'
+    recorder = None
+    _write_status(status_path, status)
+    try:
+        # moviepy and ffmpeg progress output goes to the job log as well
+        with open(os.path.join(job_dir, 'job.log'), 'a') as log, \
+                contextlib.redirect_stdout(log), contextlib.redirect_stderr(log), \
+                instrumentation.record(job['name']) as recorder:
+            steps = {
+                'crop': lambda: _crop(job, job_dir, logger),
+                'animate': lambda: _animate(job, job_dir, logger, stages['crop']),
+                'overlay': lambda: _overlay(job, job_dir, logger, stages['crop'], stages['animate']),
+            }
+            for stage in STAGES:
+                if _stage_done(stages.get(stage)):
+                    logger.info("Stage %s already done, skipping", stage)
+                    continue
+                # A redone stage invalidates everything after it
+                for later in STAGES[STAGES.index(stage):]:
+                    stages.pop(later, None)
+                logger.info("Stage %s", stage)
+                start = time.perf_counter()
+                with instrumentation.span(f'stage.{stage}'):
+                    stages[stage] = steps[stage]()
+                stages[stage]['seconds'] = round(time.perf_counter() - start, 3)
+                _write_status(status_path, status)
+        status['state'] = 'done'
+        status.pop('error', None)
+    except Exception as error:
+        logger.error("Job failed:\n%s", traceback.format_exc())
+        status['state'] = 'failed'
+        status['error'] = f'{type(error).__name__}: {error}'
+    finally:
+        if recorder is not None:
+            with open(os.path.join(job_dir, 'metrics.json'), 'w') as f:
+                f.write(recorder.to_json())
+        _write_status(status_path, status)
+        logger.removeHandler(handler)
+        handler.close()
+    return status
+
+
+def run_batch(jobs: list, output_dir: str, workers: int = None, force: bool = False) -> list:
+    """Run jobs across a process pool; returns their statuses in job order."""
+    workers = min(workers or render_pool.default_workers(), max(len(jobs), 1))
+    os.makedirs(output_dir, exist_ok=True)
+    statuses = {}
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {pool.submit(run_job, job, output_dir, force): job['name'] for job in jobs}
+        for future in as_completed(futures):
+            status = future.result()
+            statuses[futures[future]] = status
+            print(f"[{len(statuses)}/{len(jobs)}] {futures[future]}: {status['state']}"
+                  + (f" ({status['error']})" if status.get('error') else ''), flush=True)
+    return [statuses[job['name']] for job in jobs]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('source', help="JSON manifest, or a directory of GPX files with same-named videos")
+    parser.add_argument('--output-dir', default='batch_output')
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Jobs run at once (default: one less than the CPU count)")
+    parser.add_argument('--force', action='store_true', help="Rerun finished jobs from scratch")
+    args = parser.parse_args(argv)
+
+    jobs = load_jobs(args.source)
+    if not jobs:
+        print(f"No jobs found in {args.source}", file=sys.stderr)
+        return 1
+    statuses = run_batch(jobs, args.output_dir, workers=args.workers, force=args.force)
+    failed = [status['name'] for status in statuses if status['state'] != 'done']
+    print(f"{len(statuses) - len(failed)} done, {len(failed)} failed" + (f": {', '.join(failed)}" if failed else ''))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
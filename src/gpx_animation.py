@@ -1,9 +1,21 @@
 # gpx_handler.py
 import streamlit as st
-from . import gpx_utils
+from . import gpx_gauges, gpx_utils, instrumentation, render_jobs, video_encoder, video_probe
 from datetime import timedelta
+import os
 import pandas as pd
 
+def show_animation(path):
+    # Browsers cannot play the alpha-capable formats, so those get a still of the last frame
+    if path.endswith(".gif"):
+        st.image(path)
+    elif video_probe.has_alpha(path):
+        last_frame = max(video_probe.probe(path)['duration'] - 0.1, 0)
+        st.image(video_probe.thumbnail(path, last_frame, with_alpha=True),
+                 caption=f"{os.path.basename(path)} (transparent, download to view)")
+    else:
+        st.video(path)
+
 def gpx_annimation():
     st.header("GPX Annimation")
 
@@ -11,7 +23,7 @@ def gpx_annimation():
         uploaded_gpx = st.file_uploader("Upload a GPX file", type="gpx")
 
         if uploaded_gpx is not None:
-            st.session_state.gpx_cropped_df = gpx_utils.parse_gpx(uploaded_gpx)
+            st.session_state.gpx_cropped_df = gpx_utils.load_gpx(uploaded_gpx)
             if st.session_state.gpx_cropped_df.empty:
                 st.error("No valid data in GPX file.")
                 return
@@ -26,9 +38,11 @@ def gpx_annimation():
         st.plotly_chart(fig)
 
         compass_box = st.selectbox("Compass Animation?", ["Yes", "No"])
+        gauges = st.multiselect("Telemetry Gauges", gpx_gauges.GAUGES,
+                                help="Speed and distance readouts and an elevation profile, each its own animation")
 
         st.sidebar.subheader("Animation Options")
-        animation_style = st.sidebar.selectbox("Animation Backend", ["Matplotlib Animation", "Matplotlib Moviepy"])
+        animation_style = st.sidebar.selectbox("Animation Backend", ["Matplotlib Animation", "Matplotlib Moviepy", "Incremental Raster"])
         bg_color = st.sidebar.text_input("Background Color", value="white")
         bg_alpha = st.sidebar.number_input("Background Alpha", min_value=0, max_value=1, value=1)
         main_line_color = st.sidebar.text_input("Pick a Main Line Color", value="black")
@@ -38,12 +52,30 @@ def gpx_annimation():
         compass_axis_thickness = st.sidebar.number_input("Compass Axis Thickness", min_value=0, value=10)
         compass_axis_fontsize = st.sidebar.number_input("Compass Axis Fontsize", min_value=0, value=10)
         compass_heading_color = st.sidebar.text_input("Compass Heading Color", value="red")
+        render_workers = st.sidebar.number_input("Render Workers (Incremental Raster)", min_value=1,
+                                                 value=1)
+        formats = list(video_encoder.ANIMATION_FORMATS)
+        output_format = st.sidebar.selectbox("Output Format", formats,
+                                             index=formats.index(video_encoder.DEFAULT_ANIMATION_FORMAT),
+                                             help="qtrle and png keep transparency; h264 and gif play in the browser")
+        max_fps = st.sidebar.number_input("Max Animation FPS (0 = video rate)", min_value=0, value=0,
+                                          help="The overlay holds each frame until the next, so a slow "
+                                               "track can be animated at a fraction of the video's rate")
+        profiler = instrumentation.streamlit_profiler('gpx_animation_profiler')
+
+        # Remembered so the overlay page can render the GPX directly into the video
+        st.session_state.gpx_animation_options = dict(
+            bg_color=bg_color, bg_alpha=bg_alpha,
+            main_line_color=main_line_color, bg_line_color=bg_line_color,
+            gpx_map_line_width=gpx_map_line_width,
+            compass_heading_color=compass_heading_color, compass_axis_fontsize=compass_axis_fontsize,
+            compass_line_width=compass_line_width, compass_axis_thickness=compass_axis_thickness)
 
         if st.button("Create Sample Animation"):
 
             # create sample animations
-            fig = gpx_utils.gpx_animation(st.session_state.gpx_cropped_df, fps=30, 
-                                        filename="tmp_animations",
+            sample_paths = gpx_utils.cached_gpx_animation(
+                                        st.session_state.gpx_cropped_df, fps=30,
                                         overwrite_duration=True, 
                                         # General settings
                                         animation_style=animation_style, 
@@ -58,18 +90,16 @@ def gpx_annimation():
                                         compass_axis_thickness=compass_axis_thickness,
                                         compass_heading_color=compass_heading_color,
                                         compass_axis_fontsize=compass_axis_fontsize,
-                                        create_compass=True)
+                                        create_compass=True,
+                                        gauges=tuple(gauges),
+                                        # Samples are only for viewing, so always browser-playable
+                                        output_format='h264')
             # Side by side video display
-            try:
-                st.video("tmp_animations.mov")
-                st.video("tmp_animations_compass.mov")
-            except:
-                st.image("tmp_animations.gif")
-                st.image("tmp_animations_compass.gif")
+            for path in filter(None, sample_paths.values()):
+                show_animation(path)
 
         # Create animation
         if st.button("Create Animation"):
-            st.session_state.gpx_animation_path = "gpx_animation"
 
             if compass_box == "Yes":
                 compass = True  
@@ -80,8 +110,11 @@ def gpx_annimation():
             else:
                 fps = st.session_state.fps
 
-            fig = gpx_utils.gpx_animation(st.session_state.gpx_cropped_df, fps=fps, 
-                                        filename=st.session_state.gpx_animation_path, 
+            # Rendered in the background, so reruns neither block on nor restart it;
+            # identical inputs reuse the cached render instead of rendering again
+            st.session_state.gpx_animation_job = render_jobs.submit(
+                                        'GPX animation', gpx_utils.cached_gpx_animation,
+                                        st.session_state.gpx_cropped_df, fps=fps, 
                                         overwrite_duration=False,                                         
                                         animation_style=animation_style, 
                                         bg_color=bg_color, 
@@ -95,13 +128,20 @@ def gpx_annimation():
                                         compass_axis_thickness=compass_axis_thickness,
                                         compass_heading_color=compass_heading_color,
                                         compass_axis_fontsize=compass_axis_fontsize,
-                                        create_compass=compass)
-            st.video(st.session_state.gpx_animation_path + ".mp4")
-
-            with open(st.session_state.gpx_animation_path + ".mp4", "rb") as f:
-                st.download_button("Download GPX Animation", f, st.session_state.gpx_animation_path + ".mp4")
+                                        create_compass=compass,
+                                        gauges=tuple(gauges),
+                                        render_workers=render_workers,
+                                        output_format=output_format,
+                                        max_fps=max_fps or None,
+                                        profiler=profiler,
+                                        profile_path=instrumentation.profile_path(
+                                            'gpx_animation', profiler, render_jobs.streamlit_session_dir()))
 
-            if compass:
-                st.video(st.session_state.gpx_animation_path + "_compass.mov")
-                with open(st.session_state.gpx_animation_path + "_compass.mov", "rb") as f:
-                    st.download_button("Download GPX Animation", f, st.session_state.gpx_animation_path + "_compass.mp4")
\ No newline at end of file
+        job = st.session_state.get('gpx_animation_job')
+        if job is not None and render_jobs.streamlit_job(job, 'gpx_animation_job'):
+            paths = job.result()
+            st.session_state.gpx_animation_path = paths['map']
+            for path in filter(None, paths.values()):
+                show_animation(path)
+                with open(path, "rb") as f:
+                    st.download_button("Download GPX Animation", f, os.path.basename(path), key=path)
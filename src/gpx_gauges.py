@@ -0,0 +1,271 @@
+"""
+Telemetry gauges: speed and distance readouts and an elevation profile.
+
+``Telemetry`` evaluates speed, elevation and cumulative distance of a track
+at the times ``TrackResampler.frame_times`` gives for each frame. The gauge
+renderers follow the interface of ``gpx_renderer`` (``render``, ``seek``,
+``close``, ``changed``) and, like ``CompassStripRenderer``, draw everything
+static once with matplotlib:
+
+* ``ReadoutRenderer`` pre-renders the digits as a row of fixed-width glyph
+  cells and only copies the cells whose character changed into the frame.
+* ``ElevationProfileRenderer`` draws the whole profile once; each frame puts
+  back the background under the previous cursor and paints the new one.
+
+So a frame costs a few small array copies whatever the track length or the
+gauge size, and an unchanged value or cursor position reuses the frame.
+"""
+import matplotlib.pyplot as plt
+from matplotlib.colors import to_rgba
+import numpy as np
+
+from . import gpx_kinematics, gpx_resampler
+from .gpx_renderer import MIN_CHANGE, canvas_rgba, _moved
+
+GAUGES = ('speed', 'elevation', 'distance')
+# Readouts: label, units, scale from SI units and format of the value
+READOUTS = {
+    'speed': ('SPEED', 'km/h', 3.6, '{:.1f}'),
+    'distance': ('DISTANCE', 'km', 1e-3, '{:.2f}'),
+}
+GLYPHS = ' 0123456789.-'
+# Derived speeds are averaged over this many recorded points to calm GPS jitter
+SPEED_WINDOW = 5
+READOUT_FIGSIZE = (4, 1.5)
+PROFILE_FIGSIZE = (10, 3)
+
+
+def _fill_missing(values: np.ndarray) -> np.ndarray:
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return np.zeros(len(values))
+    points = np.arange(len(values))
+    return np.interp(points, points[valid], values[valid])
+
+
+def _smooth(values: np.ndarray, window: int) -> np.ndarray:
+    if len(values) < window:
+        return values
+    padded = np.pad(values, window // 2, mode='edge')
+    return np.convolve(padded, np.ones(window) / window, mode='valid')
+
+
+class Telemetry:
+    """
+    Speed (m/s), elevation (m) and cumulative distance (m) of a track at
+    arbitrary track times.
+
+    Points are filtered like ``TrackResampler`` does, so the values line up
+    with the rendered positions. Recorded speeds are used when the track has
+    any, otherwise speeds are derived from the distances. Through gaps longer
+    than ``max_gap`` the speed is 0 and the other values are held, just as the
+    position is.
+    """
+
+    def __init__(self, times, latitudes, longitudes, elevations=None, speeds=None,
+                 max_gap: float = gpx_resampler.DEFAULT_MAX_GAP):
+        self.times, index = gpx_resampler.timed_points(times)
+        if len(self.times) == 0:
+            raise ValueError("Track has no points to evaluate")
+        movement = gpx_kinematics.kinematics(np.asarray(latitudes, dtype=float)[index],
+                                             np.asarray(longitudes, dtype=float)[index], times=self.times)
+        speeds = np.zeros(len(index)) if speeds is None else np.asarray(speeds, dtype=float)[index]
+        if not (speeds > 0).any():
+            speeds = _smooth(movement['derived_speed'], SPEED_WINDOW)
+        elevations = np.full(len(index), np.nan) if elevations is None else np.asarray(elevations, dtype=float)[index]
+        self.series = {'speed': speeds, 'elevation': _fill_missing(elevations),
+                       'distance': movement['cumulative_distance']}
+        self._paused = np.append(np.diff(self.times) > max_gap, False)  # a gap follows the point
+
+    def at(self, name: str, times) -> np.ndarray:
+        """Values of series ``name`` ('speed', 'elevation' or 'distance') at track ``times``."""
+        series = self.series[name]
+        times = np.clip(np.asarray(times, dtype=float), self.times[0], self.times[-1])
+        values = np.interp(times, self.times, series)
+        points = np.searchsorted(self.times, times, side='right') - 1
+        paused = self._paused[points]
+        values[paused] = 0.0 if name == 'speed' else series[points[paused]]
+        return values
+
+
+def gauge_figure(bg_color, bg_alpha, figsize, dpi):
+    """Empty gauge figure; ``bg_alpha`` is the opacity of its background."""
+    fig = plt.figure(figsize=figsize, dpi=dpi, facecolor=bg_color, edgecolor='none')
+    fig.patch.set_alpha(bg_alpha)
+    return fig
+
+
+class ReadoutRenderer:
+    """
+    Numeric readout of a ``Telemetry`` series (one of ``READOUTS``).
+
+    The label and units are drawn once. Every character of the value is
+    rendered once as a glyph cell on the gauge's own background; a frame
+    copies only the cells whose character differs from the previous frame.
+    """
+
+    def __init__(self, resampler, telemetry, quantity, bg_color, bg_alpha, text_color, label_color,
+                 fontsize=48, figsize=READOUT_FIGSIZE, dpi=150):
+        self.resampler = resampler
+        self.telemetry = telemetry
+        self._quantity = quantity
+        label, units, self._scale, self._format = READOUTS[quantity]
+        self.changed = True
+        baseline = 0.15
+
+        fig = gauge_figure(bg_color, bg_alpha, figsize, dpi)
+        self.width, self.height = fig.canvas.get_width_height()
+        fig.text(0.05, 0.92, label, ha='left', va='top', fontsize=fontsize * 0.3, color=label_color)
+        fig.text(0.75, baseline, units, ha='left', va='baseline', fontsize=fontsize * 0.4, color=label_color)
+
+        # Glyph cells fit the widest digit (the point gets a narrow one) and the rows spanned by all of them
+        renderer = fig.canvas.get_renderer()
+        texts = [fig.text(0.5, baseline, glyph, ha='center', va='baseline', fontsize=fontsize, color=text_color)
+                 for glyph in GLYPHS]
+        extents = dict(zip(GLYPHS, (text.get_window_extent(renderer) for text in texts)))
+        for text in texts:
+            text.remove()
+        cell_width = int(np.ceil(max(extent.width for extent in extents.values()))) + 2
+        widths = {glyph: int(np.ceil(extents['.'].width)) + 2 if glyph == '.' else cell_width for glyph in GLYPHS}
+        top = max(extent.y1 for extent in extents.values())
+        bottom = min(extent.y0 for extent in extents.values())
+        self._rows = slice(max(0, self.height - int(np.ceil(top)) - 1),
+                           min(self.height, self.height - int(np.floor(bottom)) + 1))
+        self._background = canvas_rgba(fig)
+        plt.close(fig)
+
+        # Glyph row: same height and baseline as the gauge, one cell per character
+        offsets = np.concatenate(([0], np.cumsum([widths[glyph] for glyph in GLYPHS])))
+        fig = gauge_figure(bg_color, bg_alpha, ((offsets[-1] + cell_width) / dpi, figsize[1]), dpi)
+        atlas_width = fig.canvas.get_width_height()[0]
+        for glyph, left in zip(GLYPHS, offsets):
+            fig.text((left + widths[glyph] / 2) / atlas_width, baseline, glyph, ha='center', va='baseline',
+                     fontsize=fontsize, color=text_color)
+        atlas = canvas_rgba(fig)[self._rows]
+        plt.close(fig)
+        self._glyphs = {glyph: atlas[:, left:left + widths[glyph]] for glyph, left in zip(GLYPHS, offsets)}
+        self._blank = atlas[:, :cell_width]  # the ' ' cell
+
+        # One cell per character of the longest value on the track, right-aligned before the units;
+        # with a fixed number of decimals the point always lands in the same cell
+        series = telemetry.series[quantity] * self._scale
+        template = max(self._format.format(series.max()), self._format.format(series.min()), key=len)
+        self._cells = len(template)
+        cell_widths = [widths['.'] if char == '.' else cell_width for char in template]
+        right = round(0.72 * self.width)
+        self._lefts = [max(0, right - sum(cell_widths[index:])) for index in range(self._cells)]
+        self._buffer = self._background.copy()
+        self._text = ' ' * self._cells
+
+    def render_value(self, value: float) -> np.ndarray:
+        text = self._format.format(value * self._scale).rjust(self._cells)[-self._cells:]
+        self.changed = text != self._text
+        for index, (old, new) in enumerate(zip(self._text, text)):
+            if old != new:
+                glyph = self._glyphs.get(new, self._blank)
+                x = self._lefts[index]
+                self._buffer[self._rows, x:x + glyph.shape[1]] = glyph
+        self._text = text
+        return self._buffer
+
+    def render(self, frame: int) -> np.ndarray:
+        """RGBA pixels of ``frame``; the buffer is reused, so copy it to keep it past the next call."""
+        times = self.resampler.frame_times(frame, frame + 1)
+        return self.render_value(self.telemetry.at(self._quantity, times)[0])
+
+    def seek(self, frame: int):
+        pass
+
+    def close(self):
+        pass
+
+
+class ElevationProfileRenderer:
+    """
+    Elevation over distance with a cursor at the current position.
+
+    The filled profile and its minimum and maximum labels are drawn once. A
+    frame restores the columns under the previous cursor from that background
+    and paints a vertical bar and a dot at the new position, unless the
+    cursor moved by at most ``min_change`` pixels.
+    """
+
+    def __init__(self, resampler, telemetry, bg_color, bg_alpha, line_color, fill_color, cursor_color,
+                 line_width, cursor_width, fontsize=10, figsize=PROFILE_FIGSIZE, dpi=150,
+                 min_change=MIN_CHANGE):
+        self.resampler = resampler
+        self.telemetry = telemetry
+        self._min_change = min_change
+        distances = telemetry.series['distance']
+        elevations = telemetry.series['elevation']
+        low, high = elevations.min(), elevations.max()
+        margin = max(high - low, 1.0) * 0.1
+
+        fig = gauge_figure(bg_color, bg_alpha, figsize, dpi)
+        self.width, self.height = fig.canvas.get_width_height()
+        ax = fig.add_axes([0.03, 0.1, 0.94, 0.8])
+        ax.fill_between(distances, elevations, low - margin, color=fill_color, lw=0)
+        ax.plot(distances, elevations, color=line_color, lw=line_width)
+        ax.set_xlim(0, max(distances[-1], 1.0))
+        ax.set_ylim(low - margin, high + margin)
+        ax.axis('off')
+        # Labels sit above and below the axes, out of the cursor's way
+        ax.text(0, 1, f"{high:.0f} m", transform=ax.transAxes, ha='left', va='bottom', fontsize=fontsize,
+                color=line_color)
+        ax.text(0, 0, f"{low:.0f} m", transform=ax.transAxes, ha='left', va='top', fontsize=fontsize,
+                color=line_color)
+        self._background = canvas_rgba(fig)
+        self._transform = ax.transData.frozen()
+        position = ax.get_position()
+        plt.close(fig)
+
+        self._cursor_color = np.array([round(255 * c) for c in to_rgba(cursor_color)], dtype=np.uint8)
+        self._cursor_width = max(1, round(cursor_width * dpi / 72))  # points -> pixels
+        self._radius = self._cursor_width + 2
+        grid = np.arange(-self._radius, self._radius + 1)
+        self._disc = grid[:, None] ** 2 + grid[None, :] ** 2 <= self._radius ** 2
+        # Rows the cursor bar spans, and the rows a cursor can touch at all
+        self._bar_rows = (round((1 - position.y1) * self.height), round((1 - position.y0) * self.height))
+        self._rows = slice(max(0, self._bar_rows[0] - self._radius),
+                           min(self.height, self._bar_rows[1] + self._radius + 1))
+        self._buffer = self._background.copy()
+        self._pixels = None
+        self.changed = True
+
+    def _columns(self, x: int) -> slice:
+        half = max(self._radius, self._cursor_width // 2 + 1)
+        return slice(max(0, x - half), min(self.width, x + half + 1))
+
+    def _paint(self, x: int, y: int):
+        left = x - self._cursor_width // 2
+        self._buffer[self._bar_rows[0]:self._bar_rows[1], max(0, left):max(0, left + self._cursor_width)] = \
+            self._cursor_color
+        # Dot, clipped to the frame
+        y0, x0 = y - self._radius, x - self._radius
+        rows = slice(max(0, y0), min(self.height, y0 + len(self._disc)))
+        columns = slice(max(0, x0), min(self.width, x0 + len(self._disc)))
+        disc = self._disc[rows.start - y0:rows.stop - y0, columns.start - x0:columns.stop - x0]
+        self._buffer[rows, columns][disc] = self._cursor_color
+
+    def render_at(self, distance: float, elevation: float) -> np.ndarray:
+        x, y = self._transform.transform((distance, elevation))
+        pixels = (x, self.height - y)
+        self.changed = _moved(self._pixels, pixels, self._min_change)
+        if self.changed:
+            if self._pixels is not None:
+                columns = self._columns(int(round(self._pixels[0])))
+                self._buffer[self._rows, columns] = self._background[self._rows, columns]
+            self._paint(int(round(pixels[0])), int(round(pixels[1])))
+            self._pixels = pixels
+        return self._buffer
+
+    def render(self, frame: int) -> np.ndarray:
+        """RGBA pixels of ``frame``; the buffer is reused, so copy it to keep it past the next call."""
+        times = self.resampler.frame_times(frame, frame + 1)
+        return self.render_at(self.telemetry.at('distance', times)[0], self.telemetry.at('elevation', times)[0])
+
+    def seek(self, frame: int):
+        pass
+
+    def close(self):
+        pass
@@ -1,18 +1,18 @@
 # gpx_handler.py
 import streamlit as st
-from . import gpx_utils
-from datetime import timedelta
-import pandas as pd
+from . import gpx_utils, gpx_track, render_jobs
 
 
-def setup_slider(df: pd.DataFrame):
+def setup_slider(track: gpx_track.Track):
 
     # Get the duration of the GPX file in seconds
-    gpx_duration_seconds = int((df['time'].iloc[-1] - df['time'].iloc[0]).total_seconds())
+    gpx_duration_seconds = int(track.duration_seconds)
 
     if 'video_cropped_duration_seconds' in st.session_state:
         video_duration = st.session_state['video_cropped_duration_seconds']
-        st.write(f"Cropped Video Duration: {video_duration} seconds")
+        st.write(f"Cropped Video Duration: {video_duration:.2f} seconds")
+        # Crops report their actual (fractional) length; the slider works in whole seconds
+        video_duration = min(int(round(video_duration)), gpx_duration_seconds)
     else:
         video_duration = gpx_duration_seconds
 
@@ -25,11 +25,7 @@ def setup_slider(df: pd.DataFrame):
     # Calculate the end time based on the start time and fixed duration
     end_time_seconds = start_time_seconds + fixed_duration_seconds
 
-    # Convert slider values to datetime
-    start_time = df['time'].iloc[0] + timedelta(seconds=start_time_seconds)
-    end_time = df['time'].iloc[0] + timedelta(seconds=end_time_seconds)
-
-    return start_time, end_time
+    return start_time_seconds, end_time_seconds
 
 
 def gpx_handler():
@@ -40,11 +36,14 @@ def gpx_handler():
     
     uploaded_gpx = st.file_uploader("Upload a GPX file", type="gpx")
     
-    if uploaded_gpx is not None:
-        st.session_state.gpx_full_df = gpx_utils.parse_gpx(uploaded_gpx)
+    # Loaded once per upload; reruns with the same file keep the loaded track
+    if uploaded_gpx is not None and st.session_state.get('gpx_upload_id') != uploaded_gpx.file_id:
+        st.session_state.gpx_full_df = gpx_utils.load_gpx(uploaded_gpx)
         if st.session_state.gpx_full_df.empty:
             st.error("No valid data in GPX file.")
             return
+        st.session_state.gpx_track = gpx_track.Track(st.session_state.gpx_full_df)
+        st.session_state.gpx_upload_id = uploaded_gpx.file_id
 
     if st.session_state.gpx_full_df is not None:
         
@@ -57,16 +56,20 @@ def gpx_handler():
         
         # Calculate duration and convert to seconds
 
-        start_time, end_time = setup_slider(st.session_state.gpx_full_df)
-
+        if 'gpx_track' not in st.session_state:
+            st.session_state.gpx_track = gpx_track.Track(st.session_state.gpx_full_df)
+        start_seconds, end_seconds = setup_slider(st.session_state.gpx_track)
 
-        st.session_state.gpx_cropped_df = st.session_state.gpx_full_df[(st.session_state.gpx_full_df['time'] >= start_time) & (st.session_state.gpx_full_df['time'] <= end_time)]
+        # Binary search on the time index; the cropped DataFrame is a view, not a copy
+        st.session_state.gpx_cropped_track = st.session_state.gpx_track.crop_seconds(start_seconds, end_seconds)
+        st.session_state.gpx_cropped_df = st.session_state.gpx_cropped_track.df
         
         fig_cropped = gpx_utils.gpx_visualization(st.session_state.gpx_cropped_df, map_style=map_style, line_color=line_colour)
         st.plotly_chart(fig_cropped)
         
         if st.button("Save GPX"):
-            gpx_utils.save_gpx(st.session_state.gpx_cropped_df, "cropped_gpx.gpx")            
-            st.session_state['filepath_cropped_gpx'] = "cropped_gpx.gpx"
-            with open("cropped_gpx.gpx", "rb") as f:
+            cropped_gpx_path = render_jobs.streamlit_session_path("cropped_gpx.gpx")
+            gpx_utils.save_gpx(st.session_state.gpx_cropped_df, cropped_gpx_path)
+            st.session_state['filepath_cropped_gpx'] = cropped_gpx_path
+            with open(cropped_gpx_path, "rb") as f:
                 st.download_button("Download Cropped GPX", f, "cropped_gpx.gpx")
\ No newline at end of file
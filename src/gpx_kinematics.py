@@ -0,0 +1,79 @@
+"""
+Vectorised track kinematics.
+
+Every function works on whole NumPy arrays at once; ``gpx_utils.calculate_bearing``
+is kept as the scalar reference for the bearing formula.
+"""
+import numpy as np
+
+EARTH_RADIUS_M = 6_371_000.0
+
+
+def _radians(latitudes, longitudes):
+    return np.radians(np.asarray(latitudes, dtype=float)), np.radians(np.asarray(longitudes, dtype=float))
+
+
+def _bearings(phi, cos_phi, sin_phi, d_lam) -> np.ndarray:
+    x = np.sin(d_lam) * cos_phi[1:]
+    y = cos_phi[:-1] * sin_phi[1:] - sin_phi[:-1] * cos_phi[1:] * np.cos(d_lam)
+    bearings = np.empty(len(phi))
+    bearings[1:] = (np.degrees(np.arctan2(x, y)) + 360) % 360
+    # First point has no predecessor, reuse the first segment's bearing
+    bearings[0] = bearings[1] if len(phi) > 1 else 0.0
+    return bearings
+
+
+def _distances(phi, cos_phi, d_lam) -> np.ndarray:
+    a = np.sin(np.diff(phi) / 2) ** 2 + cos_phi[:-1] * cos_phi[1:] * np.sin(d_lam / 2) ** 2
+    distances = np.zeros(len(phi))
+    distances[1:] = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    return distances
+
+
+def bearings(latitudes, longitudes) -> np.ndarray:
+    """Initial bearing in degrees [0, 360) from each point's predecessor."""
+    phi, lam = _radians(latitudes, longitudes)
+    return _bearings(phi, np.cos(phi), np.sin(phi), np.diff(lam))
+
+
+def segment_distances(latitudes, longitudes) -> np.ndarray:
+    """Haversine distance in metres from each point's predecessor (0 for the first)."""
+    phi, lam = _radians(latitudes, longitudes)
+    return _distances(phi, np.cos(phi), np.diff(lam))
+
+
+def derived_speed(distances, times) -> np.ndarray:
+    """Speed in m/s from segment distances and epoch seconds; 0 where time does not advance."""
+    dt = np.diff(np.asarray(times, dtype=float), prepend=np.nan)
+    speed = np.zeros(len(dt))
+    moving = dt > 0
+    speed[moving] = np.asarray(distances)[moving] / dt[moving]
+    return speed
+
+
+def elevation_gain(elevations) -> np.ndarray:
+    """Cumulative ascent in metres; missing elevations contribute nothing."""
+    climb = np.diff(np.asarray(elevations, dtype=float), prepend=np.nan)
+    return np.cumsum(np.where(climb > 0, climb, 0.0))
+
+
+def kinematics(latitudes, longitudes, elevations=None, times=None) -> dict:
+    """
+    Compute bearing, segment and cumulative distance, and optionally derived
+    speed (needs ``times`` in epoch seconds) and elevation gain, sharing the
+    trigonometric intermediates in a single pass.
+    """
+    phi, lam = _radians(latitudes, longitudes)
+    cos_phi, sin_phi, d_lam = np.cos(phi), np.sin(phi), np.diff(lam)
+
+    distances = _distances(phi, cos_phi, d_lam)
+    result = {
+        'bearing': _bearings(phi, cos_phi, sin_phi, d_lam),
+        'distance': distances,
+        'cumulative_distance': np.cumsum(distances),
+    }
+    if times is not None:
+        result['derived_speed'] = derived_speed(distances, times)
+    if elevations is not None:
+        result['elevation_gain'] = elevation_gain(elevations)
+    return result
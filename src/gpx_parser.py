@@ -0,0 +1,144 @@
+"""
+Streaming GPX parser.
+
+Reads ``<trkpt>`` elements incrementally with ``iterparse`` and writes them
+straight into growable NumPy columns, so no gpxpy object tree or per-point
+dicts are built. Memory use is the columns themselves plus one point.
+"""
+import io
+import os
+from datetime import datetime, timedelta, timezone
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+
+NAT = np.iinfo(np.int64).min  # int64 view of NaT
+COLUMNS = ('latitude', 'longitude', 'elevation', 'time', 'speed', 'track', 'segment')
+_DTYPES = {
+    'latitude': np.float64,
+    'longitude': np.float64,
+    'elevation': np.float64,
+    'time': np.int64,  # epoch nanoseconds, NAT when missing
+    'speed': np.float64,
+    'track': np.int32,
+    'segment': np.int32,
+}
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class _Column:
+    """Preallocated NumPy buffer that doubles its capacity when full."""
+
+    def __init__(self, dtype, capacity: int = 4096):
+        self._data = np.empty(capacity, dtype=dtype)
+        self._size = 0
+
+    def append(self, value) -> None:
+        if self._size == len(self._data):
+            grown = np.empty(2 * len(self._data), dtype=self._data.dtype)
+            grown[:self._size] = self._data
+            self._data = grown
+        self._data[self._size] = value
+        self._size += 1
+
+    def finish(self) -> np.ndarray:
+        # Shrink in place rather than copying the used part
+        self._data.resize(self._size, refcheck=False)
+        return self._data
+
+
+def _local(tag: str) -> str:
+    return tag.rpartition('}')[2]
+
+
+def _parse_time(text: str) -> int:
+    dt = datetime.fromisoformat(text.strip())
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    # Integer arithmetic keeps the value exact to the microsecond
+    return (dt - _EPOCH) // _MICROSECOND * 1000
+
+
+def open_source(gpx_file):
+    """Accept a path, raw XML (str/bytes) or a binary/text file object."""
+    if isinstance(gpx_file, bytes):
+        return io.BytesIO(gpx_file)
+    if isinstance(gpx_file, str):
+        if gpx_file.lstrip().startswith('<'):
+            return io.BytesIO(gpx_file.encode('utf-8'))
+        return gpx_file
+    if isinstance(gpx_file, os.PathLike):
+        return os.fspath(gpx_file)
+    if hasattr(gpx_file, 'seek'):
+        gpx_file.seek(0)
+    return gpx_file
+
+
+def read_gpx_columns(gpx_file) -> dict:
+    """
+    Parse all track points of a GPX document into NumPy columns.
+
+    Returns a dict keyed by ``COLUMNS``. ``time`` holds epoch nanoseconds
+    (``NAT`` where a point has no time), missing elevations are NaN and
+    missing speeds are 0. ``speed`` is taken from a GPX 1.0 ``<speed>`` child
+    or any ``speed`` element inside ``<extensions>``.
+    """
+    columns = {name: _Column(_DTYPES[name]) for name in COLUMNS}
+    lat_col, lon_col = columns['latitude'], columns['longitude']
+    ele_col, time_col, speed_col = columns['elevation'], columns['time'], columns['speed']
+    track_col, segment_col = columns['track'], columns['segment']
+
+    track_id, segment_id = -1, -1
+    segment_elem = None
+    for event, elem in ET.iterparse(open_source(gpx_file), events=('start', 'end')):
+        name = _local(elem.tag)
+        if event == 'start':
+            if name == 'trk':
+                track_id += 1
+                segment_id = -1
+            elif name == 'trkseg':
+                segment_id += 1
+                segment_elem = elem
+            continue
+
+        if name != 'trkpt':
+            if name == 'trkseg':
+                segment_elem = None
+            continue
+
+        ele, time, speed = np.nan, NAT, 0.0
+        for child in elem.iter():
+            text = child.text
+            if not text:
+                continue
+            child_name = _local(child.tag)
+            if child_name == 'ele':
+                ele = float(text)
+            elif child_name == 'time':
+                time = _parse_time(text)
+            elif child_name == 'speed':
+                speed = float(text)
+
+        lat_col.append(float(elem.attrib['lat']))
+        lon_col.append(float(elem.attrib['lon']))
+        ele_col.append(ele)
+        time_col.append(time)
+        speed_col.append(speed)
+        track_col.append(track_id)
+        segment_col.append(segment_id)
+
+        # Drop the finished point (and its empty shell) from the tree
+        elem.clear()
+        if segment_elem is not None:
+            segment_elem.clear()
+
+    return {name: column.finish() for name, column in columns.items()}
+
+
+def columns_to_dataframe(columns: dict) -> pd.DataFrame:
+    """Wrap parsed columns in the DataFrame layout used by ``gpx_utils``."""
+    data = dict(columns)
+    data['time'] = pd.Series(columns['time'].view('M8[ns]')).dt.tz_localize('UTC')
+    return pd.DataFrame(data, columns=list(COLUMNS), copy=False)
@@ -0,0 +1,323 @@
+"""
+Figures and frame renderers for the track and compass animations.
+"""
+import matplotlib.pyplot as plt
+from matplotlib.colors import to_rgba
+import numpy as np
+from PIL import Image, ImageDraw
+
+from . import instrumentation
+
+DIRECTIONS = ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']
+ANGLES = np.array([0, 45, 90, 135, 180, 225, 270, 315])
+# Ticks repeat beyond 0-360 so a view centred near north never wraps the axis
+COMPASS_TICKS = np.arange(-90, 451, 45)
+COMPASS_LABELS = [DIRECTIONS[(angle // 45) % 8] for angle in COMPASS_TICKS]
+COMPASS_VIEW = 90  # degrees visible in a compass frame
+# Frames whose moving part would shift by at most this many pixels reuse the previous frame
+MIN_CHANGE = 0.5
+
+
+def track_figure(resampler, bg_color, bg_alpha, main_line_color, bg_line_color, line_width,
+                 figsize=(10, 6), dpi=150):
+    """Track map figure: the full track in the background and an empty progress line."""
+    fig, ax = plt.subplots(figsize=figsize, dpi=dpi, facecolor=bg_color, edgecolor='none')
+    ax.patch.set_alpha(bg_alpha)
+    ax.plot(resampler.longitudes, resampler.latitudes, color=bg_line_color, lw=line_width)
+    progress_line, = ax.plot([], [], color=main_line_color, lw=line_width)
+    ax.axis('off')
+    return fig, ax, progress_line
+
+
+def compass_figure(bg_color, bg_alpha, heading_color, line_width, axis_thickness, axis_fontsize,
+                   figsize=(10, 3), dpi=150):
+    """Compass strip figure with N/NE/E/... ticks and an empty heading line."""
+    fig, ax = plt.subplots(figsize=figsize, dpi=dpi, facecolor=bg_color, edgecolor='none')
+    ax.patch.set_alpha(bg_alpha)
+
+    # Set compass limits and ticks
+    ax.set_xlim([-45, 135])
+    ax.set_ylim([0, 1])
+    ax.set_xticks(COMPASS_TICKS)
+    ax.set_xticklabels(COMPASS_LABELS)
+    ax.tick_params(axis='x', which='major', labelsize=axis_fontsize)
+
+    # Set spine visibility, position and thickness
+    ax.spines['top'].set_position(('outward', -20))
+    ax.spines['bottom'].set_position(('outward', -20))
+    ax.spines['left'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.spines['top'].set_linewidth(axis_thickness)
+    ax.spines['bottom'].set_linewidth(axis_thickness)
+
+    # Remove y-ticks
+    ax.set_yticks([])
+
+    heading_line, = ax.plot([], [], color=heading_color, lw=line_width)
+    return fig, ax, heading_line
+
+
+def compass_limits(bearing: float) -> tuple:
+    """x-limits of the compass view centred on ``bearing``, kept increasing across north."""
+    bearing = bearing % 360
+    return bearing - COMPASS_VIEW / 2, bearing + COMPASS_VIEW / 2
+
+
+def canvas_rgba(fig) -> np.ndarray:
+    """Draw ``fig`` and return a copy of its RGBA pixels."""
+    with instrumentation.span('mpl_draw'):
+        fig.canvas.draw()
+    with instrumentation.span('canvas_copy'):
+        return np.array(fig.canvas.buffer_rgba())
+
+
+class MatplotlibTrackRenderer:
+    """
+    Track map renderer that redraws the whole figure every frame, unless the
+    end of the progress line moved by at most ``min_change`` pixels.
+    """
+
+    def __init__(self, resampler, bg_color, bg_alpha, main_line_color, bg_line_color, line_width,
+                 figsize=(10, 6), dpi=150, min_change=MIN_CHANGE):
+        self.resampler = resampler
+        self._fig, ax, self._line = track_figure(resampler, bg_color, bg_alpha, main_line_color,
+                                                 bg_line_color, line_width, figsize=figsize, dpi=dpi)
+        self.width, self.height = self._fig.canvas.get_width_height()
+        self._transform = ax.transData
+        self._min_change = min_change
+        self._pixels = self._image = None
+        self.changed = True  # whether the last render differs from the one before
+
+    def render(self, frame: int) -> np.ndarray:
+        latitudes, longitudes = self.resampler.trail(frame)
+        pixels = self._transform.transform((longitudes[-1], latitudes[-1])) if len(latitudes) else None
+        self.changed = self._image is None or _moved(self._pixels, pixels, self._min_change)
+        if self.changed:
+            self._line.set_data(longitudes, latitudes)
+            self._image, self._pixels = canvas_rgba(self._fig), pixels
+        return self._image
+
+    def seek(self, frame: int):
+        pass
+
+    def close(self):
+        plt.close(self._fig)
+
+
+class MatplotlibCompassRenderer:
+    """
+    Compass renderer that moves the axis limits and redraws the figure every
+    frame, unless the scale would shift by at most ``min_change`` pixels.
+    """
+
+    def __init__(self, resampler, bg_color, bg_alpha, heading_color, line_width, axis_thickness,
+                 axis_fontsize, figsize=(10, 3), dpi=150, min_change=MIN_CHANGE):
+        self.resampler = resampler
+        self._fig, self._ax, self._line = compass_figure(bg_color, bg_alpha, heading_color, line_width,
+                                                         axis_thickness, axis_fontsize,
+                                                         figsize=figsize, dpi=dpi)
+        self.width, self.height = self._fig.canvas.get_width_height()
+        self._pixels_per_degree = self._ax.get_position().width * self.width / COMPASS_VIEW
+        self._min_change = min_change
+        self._pixels = self._image = None
+        self.changed = True
+
+    def render(self, frame: int) -> np.ndarray:
+        bearing = self.resampler.bearings(frame, frame + 1)[0]
+        pixels = compass_limits(bearing)[0] * self._pixels_per_degree
+        self.changed = self._image is None or _moved(self._pixels, pixels, self._min_change)
+        if self.changed:
+            self._line.set_data([bearing, bearing], [0, 1])
+            self._ax.set_xlim(compass_limits(bearing))
+            self._image, self._pixels = canvas_rgba(self._fig), pixels
+        return self._image
+
+    def seek(self, frame: int):
+        pass
+
+    def close(self):
+        plt.close(self._fig)
+
+
+class CompassStripRenderer:
+    """
+    Compass renderer that crops frames out of one pre-rendered strip.
+
+    The compass scale from -90 to 450 degrees is drawn once, in the configured
+    style, as a single wide image. Each frame copies the 90 degree window
+    around the heading into the axes area of a persistent frame buffer and
+    paints the heading marker down the middle, so no drawing happens per frame.
+    """
+
+    def __init__(self, resampler, bg_color, bg_alpha, heading_color, line_width, axis_thickness,
+                 axis_fontsize, figsize=(10, 3), dpi=150, min_change=MIN_CHANGE):
+        self.resampler = resampler
+        self._min_change = min_change
+        self._offset = None
+        self.changed = True
+        style = (bg_color, bg_alpha, heading_color, line_width, axis_thickness, axis_fontsize)
+
+        # Frame layout: the figure without its axes gives the surrounding background
+        fig, ax, _ = compass_figure(*style, figsize=figsize, dpi=dpi)
+        self.width, self.height = fig.canvas.get_width_height()
+        position = ax.get_position()
+        self._x0 = round(position.x0 * self.width)
+        self._view_width = round(position.width * self.width)
+        ax.set_visible(False)
+        self._buffer = canvas_rgba(fig)
+        plt.close(fig)
+
+        # Strip: same height and vertical layout, with the axes spanning the full width
+        start, stop = COMPASS_TICKS[0], COMPASS_TICKS[-1]
+        strip_width = self._view_width * (stop - start) / COMPASS_VIEW
+        fig, ax, _ = compass_figure(*style, figsize=(strip_width / dpi, figsize[1]), dpi=dpi)
+        ax.set_position([0, position.y0, 1, position.height])
+        ax.set_xlim(start, stop)
+        self._strip = canvas_rgba(fig)
+        plt.close(fig)
+        self._start = start
+        self._pixels_per_degree = self._strip.shape[1] / (stop - start)
+
+        # Heading marker: a vertical bar down the centre of the axes
+        marker_width = max(1, round(line_width * dpi / 72))
+        centre = self._x0 + self._view_width // 2
+        self._marker_x = slice(centre - marker_width // 2, centre - marker_width // 2 + marker_width)
+        self._marker_y = slice(round((1 - position.y1) * self.height), round((1 - position.y0) * self.height))
+        self._marker_color = np.array([round(255 * c) for c in to_rgba(heading_color)], dtype=np.uint8)
+
+    def render_bearing(self, bearing: float) -> np.ndarray:
+        left = compass_limits(bearing)[0]
+        offset = int(round((left - self._start) * self._pixels_per_degree))
+        self.changed = self._offset is None or _moved(self._offset, offset, self._min_change)
+        if self.changed:
+            self._buffer[:, self._x0:self._x0 + self._view_width] = \
+                self._strip[:, offset:offset + self._view_width]
+            self._buffer[self._marker_y, self._marker_x] = self._marker_color
+            self._offset = offset
+        return self._buffer
+
+    def render(self, frame: int) -> np.ndarray:
+        """RGBA pixels of ``frame``; the buffer is reused, so copy it to keep it past the next call."""
+        return self.render_bearing(self.resampler.bearings(frame, frame + 1)[0])
+
+    def seek(self, frame: int):
+        pass
+
+    def close(self):
+        pass
+
+
+def _moved(previous, current, min_change: float) -> bool:
+    """Whether a pixel position (or offset) moved by more than ``min_change`` pixels."""
+    if previous is None or current is None:
+        return previous is not current
+    return np.max(np.abs(np.subtract(current, previous))) > min_change
+
+
+def iter_frames(renderer, start: int, stop: int, skip_unchanged: bool = False):
+    """
+    Yield the frames ``start`` to ``stop - 1`` of ``renderer``, closing it
+    afterwards. With ``skip_unchanged``, frames the renderer reports as
+    unchanged (``renderer.changed``) are yielded as None after the first.
+    """
+    try:
+        renderer.seek(start)
+        for frame in range(start, stop):
+            image = renderer.render(frame)
+            yield None if skip_unchanged and frame > start and not renderer.changed else image
+    finally:
+        renderer.close()
+
+
+class RasterTrackRenderer:
+    """
+    Track map renderer that only draws what changed since the previous frame.
+
+    The background track is rasterised once with matplotlib; each frame then
+    strokes just the newly travelled part of the progress line onto a
+    persistent RGBA buffer with Pillow, touching only the stroke's bounding
+    box, so the cost per frame does not grow with the track length.
+    """
+
+    def __init__(self, resampler, bg_color, bg_alpha, main_line_color, bg_line_color, line_width,
+                 figsize=(10, 6), dpi=150, min_change=MIN_CHANGE):
+        self.resampler = resampler
+        self._min_change = min_change
+        fig, ax, _ = track_figure(resampler, bg_color, bg_alpha, main_line_color, bg_line_color,
+                                  line_width, figsize=figsize, dpi=dpi)
+        self._background = canvas_rgba(fig)
+        self._transform = ax.transData.frozen()
+        plt.close(fig)
+
+        self.height, self.width = self._background.shape[:2]
+        self._line_color = tuple(round(255 * c) for c in to_rgba(main_line_color))
+        self._line_width = max(1, round(line_width * dpi / 72))  # points -> pixels
+        self._reset()
+
+    def _reset(self):
+        self._buffer = self._background.copy()
+        self._frame = 0
+        self._last_time = self.resampler.start_time
+        self._last_pixels = None
+        self.changed = True
+
+    def _to_pixels(self, latitudes, longitudes) -> np.ndarray:
+        xy = self._transform.transform(np.column_stack([longitudes, latitudes]))
+        xy[:, 1] = self.height - xy[:, 1]
+        return xy
+
+    def _stroke(self, xy: np.ndarray):
+        # Only the bounding box of the new stroke is handed to Pillow and written back
+        radius = self._line_width / 2
+        x0, y0 = np.maximum(np.floor(xy.min(axis=0) - radius - 1).astype(int), 0)
+        x1, y1 = np.ceil(xy.max(axis=0) + radius + 2).astype(int)
+        region = self._buffer[y0:y1, x0:x1]
+        if region.size == 0:
+            return
+        image = Image.fromarray(region, 'RGBA')
+        draw = ImageDraw.Draw(image)
+        points = [(x - x0, y - y0) for x, y in xy]
+        draw.line(points, fill=self._line_color, width=self._line_width, joint='curve')
+        # Round the ends so consecutive strokes join without gaps
+        for x, y in (points[0], points[-1]):
+            draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=self._line_color)
+        region[...] = np.asarray(image)
+
+    def advance(self, frame: int):
+        """Stroke the progress line from the last drawn frame up to ``frame``."""
+        if frame < self._frame:
+            self._reset()
+        if frame == self._frame:
+            return
+        time = self.resampler.frame_times(frame, frame + 1)
+        end_lat, end_lon = self.resampler.positions_at(time)
+        end_pixels = self._to_pixels(end_lat, end_lon)[0]
+        self._frame = frame
+        # While (nearly) stopped the stroke is left to accumulate and the buffer stays as it is
+        self.changed = _moved(self._last_pixels, end_pixels, self._min_change)
+        if not self.changed:
+            return
+        # Recorded points passed since the last stroke, bracketed by the interpolated positions
+        times = self.resampler.times
+        first = np.searchsorted(times, self._last_time, side='right')
+        last = np.searchsorted(times, time[0], side='right')
+        start_lat, start_lon = self.resampler.positions_at([self._last_time])
+        latitudes = np.concatenate((start_lat, self.resampler.latitudes[first:last], end_lat))
+        longitudes = np.concatenate((start_lon, self.resampler.longitudes[first:last], end_lon))
+        self._stroke(self._to_pixels(latitudes, longitudes))
+        self._last_time, self._last_pixels = time[0], end_pixels
+
+    def render(self, frame: int) -> np.ndarray:
+        """RGBA pixels of ``frame``; the buffer is reused, so copy it to keep it past the next call."""
+        self.advance(frame)
+        return self._buffer
+
+    def seek(self, frame: int):
+        """Bring the buffer to the state just before ``frame``, one frame at a time like a serial render."""
+        if frame - 1 < self._frame:
+            self._reset()
+        for previous in range(self._frame + 1, frame):
+            self.advance(previous)
+
+    def close(self):
+        pass
@@ -0,0 +1,141 @@
+"""
+Time-keyed, lazily evaluated track resampling.
+
+``TrackResampler`` fits splines over the real timestamps of the recorded
+points and evaluates positions only for the frames that are asked for, so
+memory depends on the number of recorded points, not on fps * duration.
+"""
+import numpy as np
+import pandas as pd
+from scipy.interpolate import CubicSpline
+
+from . import gpx_kinematics
+
+# Points further apart in time than this are treated as a pause: the
+# position is held at the last point instead of splining across the gap.
+DEFAULT_MAX_GAP = 10.0
+# Recorded points closer than this do not define a heading (GPS jitter)
+STATIONARY_M = 0.5
+# Frames closer than this are held positions, whose heading is undefined
+FRAME_EPSILON_M = 1e-3
+
+
+def epoch_seconds(times) -> np.ndarray:
+    """Seconds since the epoch for a datetime Series/array; NaN for missing times."""
+    times = pd.to_datetime(pd.Series(times), utc=True)
+    return (times - pd.Timestamp(0, tz='UTC')).dt.total_seconds().to_numpy()
+
+
+def _forward_fill(values: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    if not valid.any():
+        return np.zeros(len(values))
+    idx = np.where(valid, np.arange(len(values)), 0)
+    np.maximum.accumulate(idx, out=idx)
+    filled = values[idx]
+    filled[:np.argmax(valid)] = values[np.argmax(valid)]
+    return filled
+
+
+def timed_points(times) -> tuple:
+    """
+    Times and indices of the points that can be played back: those with a
+    time, keeping the first of repeated timestamps. One second per point is
+    assumed if no point has a time.
+    """
+    times = np.asarray(times, dtype=float)
+    if np.isnan(times).all():
+        times = np.arange(len(times), dtype=float)
+    index = np.flatnonzero(~np.isnan(times))
+    index = index[np.diff(times[index], prepend=-np.inf) > 0]
+    return times[index], index
+
+
+class TrackResampler:
+    """
+    Evaluate track positions and headings at video frame times.
+
+    ``times`` are epoch seconds of the recorded points. Points without a time
+    are dropped, and repeated timestamps keep the first point. If no point has
+    a time, one second per point is assumed. When ``duration`` is given the
+    whole track is played back in that many seconds (used for previews).
+    """
+
+    def __init__(self, times, latitudes, longitudes, fps: float = 30, duration: float = None,
+                 max_gap: float = DEFAULT_MAX_GAP):
+        self.times, index = timed_points(times)
+        self.latitudes = np.asarray(latitudes, dtype=float)[index]
+        self.longitudes = np.asarray(longitudes, dtype=float)[index]
+        if len(self.times) == 0:
+            raise ValueError("Track has no points to resample")
+
+        self.fps = fps
+        self.start_time = self.times[0]
+        self.track_duration = self.times[-1] - self.times[0]
+        self.duration = self.track_duration if duration is None else duration
+        self.num_frames = int(fps * self.duration)
+        self._time_scale = self.track_duration / self.duration if self.duration > 0 else 0.0
+
+        # Split into runs of regularly logged points and fit one spline per run
+        breaks = np.flatnonzero(np.diff(self.times) > max_gap) + 1
+        bounds = np.concatenate(([0], breaks, [len(self.times)]))
+        self._run_starts = self.times[bounds[:-1]]
+        self._run_ends = self.times[bounds[1:] - 1]
+        points = np.column_stack([self.latitudes, self.longitudes])
+        self._splines = []
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            if hi - lo > 1:
+                self._splines.append(CubicSpline(self.times[lo:hi], points[lo:hi]))
+            else:
+                self._splines.append(points[lo])
+
+        # Heading of each recorded point, carried across stationary stretches
+        movement = gpx_kinematics.kinematics(self.latitudes, self.longitudes)
+        moving = movement['distance'] >= STATIONARY_M
+        moving[0] = len(moving) > 1 and moving[1]
+        self._point_bearings = _forward_fill(movement['bearing'], moving)
+
+    def frame_times(self, start: int, stop: int) -> np.ndarray:
+        """Track time (epoch seconds) shown by frames ``start`` to ``stop - 1``."""
+        return self.start_time + np.arange(start, stop) / self.fps * self._time_scale
+
+    def positions_at(self, times) -> tuple:
+        """Latitudes and longitudes at arbitrary track times, holding position through gaps."""
+        times = np.clip(np.asarray(times, dtype=float), self.times[0], self.times[-1])
+        runs = np.searchsorted(self._run_starts, times, side='right') - 1
+        times = np.minimum(times, self._run_ends[runs])
+        points = np.empty((len(times), 2))
+        for run in np.unique(runs):
+            in_run = runs == run
+            spline = self._splines[run]
+            points[in_run] = spline(times[in_run]) if callable(spline) else spline
+        return points[:, 0], points[:, 1]
+
+    def positions(self, start: int, stop: int) -> tuple:
+        """Latitudes and longitudes for frames ``start`` to ``stop - 1``."""
+        return self.positions_at(self.frame_times(start, stop))
+
+    def bearings(self, start: int, stop: int) -> np.ndarray:
+        """Heading in degrees for frames ``start`` to ``stop - 1``."""
+        times = self.frame_times(start - 1, stop)
+        latitudes, longitudes = self.positions_at(times)
+        movement = gpx_kinematics.kinematics(latitudes, longitudes)
+        # While stopped, use the heading of the last recorded movement
+        points = np.searchsorted(self.times, times, side='right') - 1
+        fallback = self._point_bearings[np.clip(points, 0, None)]
+        bearings = np.where(movement['distance'] >= FRAME_EPSILON_M, movement['bearing'], fallback)
+        return bearings[1:]
+
+    def iter_chunks(self, chunk_size: int = 1024):
+        """Yield ``(start, latitudes, longitudes, bearings)`` for consecutive frame chunks."""
+        for start in range(0, self.num_frames, chunk_size):
+            stop = min(start + chunk_size, self.num_frames)
+            latitudes, longitudes = self.positions(start, stop)
+            yield start, latitudes, longitudes, self.bearings(start, stop)
+
+    def trail(self, frame: int) -> tuple:
+        """Recorded points up to ``frame`` plus the interpolated current position."""
+        time = self.frame_times(frame, frame + 1)
+        latitude, longitude = self.positions_at(time)
+        count = np.searchsorted(self.times, time[0], side='right')
+        return (np.append(self.latitudes[:count], latitude),
+                np.append(self.longitudes[:count], longitude))
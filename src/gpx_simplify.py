@@ -0,0 +1,108 @@
+"""
+Level-of-detail track simplification for map views.
+
+Every point gets a Douglas-Peucker importance: the largest tolerance (in
+metres) at which Douglas-Peucker would still keep it. Thresholding the
+importance gives the Douglas-Peucker simplification for any tolerance, and
+taking the most important points gives the best shape for a point budget, so
+the ranking is computed once per track and every zoom level or budget is a
+cheap selection from it.
+"""
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from . import gpx_kinematics
+
+# Web-mercator ground resolution at zoom 0 on the equator, metres per pixel
+METRES_PER_PIXEL_Z0 = 156543.03392
+DEFAULT_MAX_POINTS = 2000
+_CACHE_SIZE = 8
+_importance_cache = OrderedDict()
+
+
+def _project(latitudes, longitudes) -> tuple:
+    # Local equirectangular projection in metres; plenty for a single track
+    phi, lam = np.radians(latitudes), np.radians(longitudes)
+    scale = np.cos(np.nanmean(phi)) if len(phi) else 1.0
+    return gpx_kinematics.EARTH_RADIUS_M * lam * scale, gpx_kinematics.EARTH_RADIUS_M * phi
+
+
+def dp_importance(latitudes, longitudes) -> np.ndarray:
+    """
+    Douglas-Peucker importance of every point in metres; the end points are
+    ``inf``. All segments of one recursion level are split in a single
+    vectorised pass.
+    """
+    x, y = _project(np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float))
+    n = len(x)
+    importance = np.full(n, np.inf)
+    if n < 3:
+        return importance
+    importance[1:-1] = 0.0
+
+    starts, ends, caps = np.array([0]), np.array([n - 1]), np.array([np.inf])
+    while len(starts):
+        interior = ends - starts - 1
+        active = interior > 0
+        starts, ends, caps, interior = starts[active], ends[active], caps[active], interior[active]
+        if not len(starts):
+            break
+        segment = np.repeat(np.arange(len(starts)), interior)
+        offsets = np.cumsum(interior) - interior
+        points = starts[segment] + 1 + np.arange(interior.sum()) - offsets[segment]
+
+        # Distance of each interior point from its segment's chord
+        ax, ay = x[starts][segment], y[starts][segment]
+        dx, dy = x[ends][segment] - ax, y[ends][segment] - ay
+        chord = np.hypot(dx, dy)
+        px, py = x[points] - ax, y[points] - ay
+        distance = np.where(chord > 0, np.abs(dx * py - dy * px) / np.where(chord > 0, chord, 1),
+                            np.hypot(px, py))
+
+        # Split each segment at its first farthest point
+        farthest = np.maximum.reduceat(distance, offsets)
+        candidates = np.flatnonzero(distance == farthest[segment])
+        _, first = np.unique(segment[candidates], return_index=True)
+        split = points[candidates[first]]
+        # A point can never outlive the split that exposed it
+        split_importance = np.minimum(farthest, caps)
+        importance[split] = split_importance
+
+        starts, ends = np.concatenate((starts, split)), np.concatenate((split, ends))
+        caps = np.concatenate((split_importance, split_importance))
+    return importance
+
+
+def track_importance(latitudes, longitudes) -> np.ndarray:
+    """``dp_importance`` cached by the track's coordinates; the result is read-only."""
+    latitudes = np.ascontiguousarray(latitudes, dtype=float)
+    longitudes = np.ascontiguousarray(longitudes, dtype=float)
+    key = hashlib.sha1(latitudes.tobytes() + longitudes.tobytes()).hexdigest()
+    if key in _importance_cache:
+        _importance_cache.move_to_end(key)
+        return _importance_cache[key]
+    importance = dp_importance(latitudes, longitudes)
+    importance.flags.writeable = False
+    _importance_cache[key] = importance
+    if len(_importance_cache) > _CACHE_SIZE:
+        _importance_cache.popitem(last=False)
+    return importance
+
+
+def zoom_tolerance(zoom: float, latitude: float, pixels: float = 1.0) -> float:
+    """Ground distance in metres covered by ``pixels`` screen pixels at a web-map ``zoom``."""
+    return pixels * METRES_PER_PIXEL_Z0 * np.cos(np.radians(latitude)) / 2 ** zoom
+
+
+def simplify(latitudes, longitudes, tolerance: float = 0.0, max_points: int = None) -> np.ndarray:
+    """
+    Sorted indices of the points to draw: those more important than
+    ``tolerance`` metres, reduced to the ``max_points`` most important.
+    """
+    importance = track_importance(latitudes, longitudes)
+    keep = np.flatnonzero(importance > tolerance)
+    if max_points is not None and len(keep) > max_points:
+        keep = np.sort(keep[np.argsort(-importance[keep], kind='stable')[:max(max_points, 2)]])
+    return keep
@@ -0,0 +1,63 @@
+"""
+Track with a sorted time index.
+
+Crops resolve to a start/stop row slice by binary search over epoch
+nanoseconds, and the cropped track is a view of the same columns rather than
+a filtered copy.
+"""
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from . import gpx_parser
+
+
+class Track:
+    """
+    GPX points as a DataFrame plus a monotonic epoch-nanosecond time index.
+
+    Points are put in time order once, on construction, with points that
+    have no time at the end; those are never part of a time crop.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        times = df['time'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        if len(times) > 1 and np.any(times[1:] < times[:-1]):
+            # NAT is the smallest int64, so sort it behind every real time
+            order = np.argsort(np.where(times == gpx_parser.NAT, np.iinfo(np.int64).max, times), kind='stable')
+            df = df.iloc[order].reset_index(drop=True)
+            times = df['time'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        self.df = df
+        self._times = times[:np.count_nonzero(times != gpx_parser.NAT)]
+        self._times.flags.writeable = False
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    @property
+    def start_time(self) -> pd.Timestamp:
+        return pd.Timestamp(self._times[0], tz='UTC') if len(self._times) else pd.NaT
+
+    @property
+    def end_time(self) -> pd.Timestamp:
+        return pd.Timestamp(self._times[-1], tz='UTC') if len(self._times) else pd.NaT
+
+    @property
+    def duration_seconds(self) -> float:
+        return (self._times[-1] - self._times[0]) / 1e9 if len(self._times) else 0.0
+
+    def time_slice(self, start_time, end_time) -> slice:
+        """Rows with ``start_time <= time <= end_time``, found by binary search."""
+        start = np.searchsorted(self._times, pd.Timestamp(start_time).value, side='left')
+        stop = np.searchsorted(self._times, pd.Timestamp(end_time).value, side='right')
+        return slice(int(start), int(max(start, stop)))
+
+    def crop(self, start_time, end_time) -> 'Track':
+        """Track between two times; its DataFrame is a view of this one's columns."""
+        return Track(self.df.iloc[self.time_slice(start_time, end_time)])
+
+    def crop_seconds(self, start_seconds: float, end_seconds: float) -> 'Track':
+        """Crop by seconds from the start of the track."""
+        return self.crop(self.start_time + timedelta(seconds=start_seconds),
+                         self.start_time + timedelta(seconds=end_seconds))
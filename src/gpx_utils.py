@@ -1,7 +1,6 @@
 """
 GPX Utils
 """
-import streamlit as st
 import gpxpy
 import gpxpy.gpx
 import pandas as pd
@@ -9,75 +8,72 @@ import plotly.express as px
 from datetime import timedelta
 import matplotlib.animation as animation
 import matplotlib.pyplot as plt
-from scipy.interpolate import CubicSpline
-import numpy as np
 from moviepy.editor import VideoClip
 import plotly.graph_objects as go
 from math import radians, sin, cos, atan2, degrees
-from moviepy.editor import ImageSequenceClip
+import inspect
+import os
+from . import gpx_parser, gpx_kinematics, gpx_resampler, gpx_renderer, gpx_gauges, video_encoder, render_pool, render_cache, gpx_simplify, gpx_writer, instrumentation, track_store, video_utils
+
+
+def streamlit_progress(text: str):
+    """Progress callback backed by a Streamlit progress bar (imported lazily for headless use)."""
+    import streamlit as st
+    bar = st.progress(0, text=text)
+    last = [-1]
+
+    def update(fraction):
+        # Only whole percents go over the websocket, not every frame
+        percent = int(fraction * 100)
+        if percent != last[0]:
+            last[0] = percent
+            bar.progress(percent, text=text)
+    return update
 
 
 def parse_gpx(gpx_file: str) -> pd.DataFrame:
 
-    gpx = gpxpy.parse(gpx_file)
-    points = []
-    for track in gpx.tracks:
-        for segment in track.segments:
-            for point in segment.points:
-                points.append({
-                    'latitude': point.latitude,
-                    'longitude': point.longitude,
-                    'elevation': point.elevation,
-                    'time': point.time,
-                    'speed': point.speed if point.speed is not None else 0  # Handle missing speed
-                })
-    return pd.DataFrame(points)
+    # Stream <trkpt> elements into NumPy columns instead of building a gpxpy tree
+    with instrumentation.span('parse_gpx'):
+        df = gpx_parser.columns_to_dataframe(gpx_parser.read_gpx_columns(gpx_file))
+    instrumentation.count('gpx_points', len(df))
+    return df
+
+def load_gpx(gpx_file) -> pd.DataFrame:
+
+    # Parsed once per file content, then memory-mapped from the track store
+    return track_store.open_track(gpx_file)
 
 def gpx_to_pd(gpx: gpxpy.gpx.GPX) -> pd.DataFrame:
-    points = []
-    for track in gpx.tracks:
-        for segment in track.segments:
-            for point in segment.points:
-                points.append({
-                    'latitude': point.latitude,
-                    'longitude': point.longitude,
-                    'elevation': point.elevation,
-                    'time': point.time,
-                    'speed': point.speed if point.speed is not None else 0  # Handle missing speed
-                })
-    return pd.DataFrame(points)
-
-
-def gpx_visualization(df: pd.DataFrame, map_style: str = 'open-street-map', line_color: str = '#FF0000') -> px.line_mapbox:
+    return parse_gpx(gpx.to_xml())
+
+
+def gpx_visualization(df: pd.DataFrame, map_style: str = 'open-street-map', line_color: str = '#FF0000',
+                      zoom: float = 12, max_points: int = gpx_simplify.DEFAULT_MAX_POINTS) -> px.line_mapbox:
+    """
+    Map of the track, simplified to what is visible at ``zoom`` (half a pixel)
+    and at most ``max_points`` points; ``max_points=None`` draws every point.
+    """
+    center = {"lat": df['latitude'].mean(), "lon": df['longitude'].mean()}
+    if max_points is not None:
+        tolerance = gpx_simplify.zoom_tolerance(zoom, center["lat"], pixels=0.5)
+        with instrumentation.span('simplify'):
+            keep = gpx_simplify.simplify(df['latitude'].values, df['longitude'].values, tolerance, max_points)
+        df = df[['latitude', 'longitude']].iloc[keep]
 
     fig = px.line_mapbox(df, lat="latitude", lon="longitude", height=500)
     fig.update_layout(mapbox_style=map_style, margin={"r":0,"t":0,"l":0,"b":0}, 
-                      mapbox_center={"lat": df['latitude'].mean(), "lon": df['longitude'].mean()}, 
-                      mapbox_zoom=12)
+                      mapbox_center=center, 
+                      mapbox_zoom=zoom)
     fig.update_traces(line=dict(color=line_color))
 
     return fig
 
 
-def save_gpx(df: pd.DataFrame, filename: str) -> None:
-
-    new_gpx = gpxpy.gpx.GPX()
-    new_track = gpxpy.gpx.GPXTrack()
-    new_gpx.tracks.append(new_track)
-    new_segment = gpxpy.gpx.GPXTrackSegment()
-    new_track.segments.append(new_segment)
-    
-    for _, row in df.iterrows():
-        new_point = gpxpy.gpx.GPXTrackPoint(
-            latitude=row['latitude'],
-            longitude=row['longitude'],
-            elevation=row['elevation'],
-            time=row['time']
-        )
-        new_segment.points.append(new_point)
-    
-    with open(filename, "w") as f:
-        f.write(new_gpx.to_xml())
+def save_gpx(df: pd.DataFrame, filename) -> None:
+    """Write ``df`` as GPX to a path or file object, streaming it in chunks."""
+    with instrumentation.span('write_gpx'):
+        gpx_writer.write_gpx(df, filename)
 
 def gpx_animation(df: pd.DataFrame, fps: int = 30, filename: str='gpx_animation',
                   create_compass: bool=False,
@@ -87,231 +83,296 @@ def gpx_animation(df: pd.DataFrame, fps: int = 30, filename: str='gpx_animation'
                   gpx_map_line_width: float=2, 
                   compass_heading_color: str='#0000FF', compass_axis_fontsize: int=10,
                   compass_line_width: float=1,
-                  compass_axis_thickness: float=1, overwrite_duration: bool=False) -> None:
+                  compass_axis_thickness: float=1, overwrite_duration: bool=False,
+                  render_workers: int=1, progress=streamlit_progress,
+                  output_format: str=video_encoder.DEFAULT_ANIMATION_FORMAT, max_fps: float=None,
+                  gauges: tuple=()) -> None:
     """
     Requires matplotlib <= 3.6.0 for transparent animation.
+    render_workers > 1 renders the Incremental Raster style in chunks across a process pool.
+    progress(text) returns a callback taking the completed fraction of each video rendered.
+    output_format is a video_encoder.ANIMATION_FORMATS name; 'qtrle' and 'png' keep the alpha channel.
+    max_fps caps the animation's frame rate; overlay_videos holds each frame until the next,
+    so a slow-moving track can be rendered and encoded at a fraction of the video's rate.
+    gauges names gpx_gauges.GAUGES to render as well, each into filename + '_' + gauge.
     """
+    video_encoder.animation_format(output_format)  # fail before rendering anything
+    if max_fps:
+        fps = min(fps, max_fps)
 
-    latitudes = df['latitude'].values
-    longitudes = df['longitude'].values
-    times = df['time'].apply(lambda t: t.timestamp()).values
-    total_duration = times[-1] - times[0]
-    if overwrite_duration:
-        total_duration = 10 # just make a 10-second preview
+    # Positions are evaluated per frame from splines over the real timestamps
+    with instrumentation.span('resample_setup'):
+        resampler = gpx_resampler.TrackResampler(gpx_resampler.epoch_seconds(df['time']),
+                                                 df['latitude'].values, df['longitude'].values, fps=fps,
+                                                 duration=10 if overwrite_duration else None) # 10-second preview
 
-    num_frames = int(fps * total_duration)
+    num_frames = resampler.num_frames
     interval = 1000 / fps
 
-    # Optionally interpolate/smooth the data
-    if len(latitudes) > 2:
-        # Cubic Spline interpolation for smoother path
-        cs_lat = CubicSpline(np.arange(len(latitudes)), latitudes)
-        cs_lon = CubicSpline(np.arange(len(longitudes)), longitudes)
-
-        # Adjust factor as needed
-        new_indices = np.linspace(0, len(latitudes) - 1, num=int(total_duration * fps))  
-        latitudes = cs_lat(new_indices)
-        longitudes = cs_lon(new_indices)
-    else:
-        # Handle very few points gracefully
-        new_indices = np.arange(len(latitudes))
-    latitudes, longitudes = np.array(latitudes), np.array(longitudes)
-
     if animation_style == 'Matplotlib Animation':
-        process_gpx_mpl_animation(filename, fps, num_frames, interval, latitudes, longitudes,
+        process_gpx_mpl_animation(filename, fps, num_frames, interval, resampler,
                                   bg_color, bg_alpha, main_line_color, bg_line_color,
                                   gpx_map_line_width, compass_heading_color, compass_line_width,
-                                  compass_axis_thickness, compass_axis_fontsize, create_compass)
+                                  compass_axis_thickness, compass_axis_fontsize, create_compass, progress,
+                                  output_format)
     elif animation_style == 'Matplotlib Moviepy':
-        process_gpx_mpl_movpy(filename, fps, num_frames, interval, latitudes, longitudes, bg_color, bg_alpha,
+        process_gpx_mpl_movpy(filename, fps, num_frames, interval, resampler, bg_color, bg_alpha,
                             main_line_color, bg_line_color,
                             gpx_map_line_width, compass_heading_color, compass_line_width,
-                            compass_axis_thickness, compass_axis_fontsize, create_compass)
+                            compass_axis_thickness, compass_axis_fontsize, create_compass, progress,
+                            output_format)
+    elif animation_style == 'Incremental Raster':
+        process_gpx_raster(filename, fps, num_frames, resampler, bg_color, bg_alpha,
+                           main_line_color, bg_line_color,
+                           gpx_map_line_width, compass_heading_color, compass_line_width,
+                           compass_axis_thickness, compass_axis_fontsize, create_compass, progress,
+                           workers=render_workers, output_format=output_format)
+
+    if gauges:
+        with instrumentation.span('telemetry_setup'):
+            telemetry = track_telemetry(df)
+        style = dict(bg_color=bg_color, bg_alpha=bg_alpha, main_line_color=main_line_color,
+                     bg_line_color=bg_line_color, gpx_map_line_width=gpx_map_line_width,
+                     compass_heading_color=compass_heading_color, compass_line_width=compass_line_width,
+                     compass_axis_fontsize=compass_axis_fontsize)
+        extension = video_encoder.animation_format(output_format)[0]
+        for gauge in gauges:
+            renderer_cls, renderer_kwargs = gauge_renderer_args(gauge, resampler, telemetry, **style)
+            progress_bar = progress(f"Creating {gauge.title()} Gauge with {num_frames} frames...")
+            render_video(renderer_cls, renderer_kwargs, num_frames, f'{filename}_{gauge}{extension}', fps,
+                         workers=render_workers, progress=progress_bar, output_format=output_format)
+
+
+def track_telemetry(df: pd.DataFrame) -> gpx_gauges.Telemetry:
+    """Speed, elevation and cumulative distance of the track, for the gauges."""
+    return gpx_gauges.Telemetry(gpx_resampler.epoch_seconds(df['time']), df['latitude'].values,
+                                df['longitude'].values, df['elevation'].values, df['speed'].values)
+
+
+def gauge_renderer_args(gauge: str, resampler, telemetry, bg_color: str='None', bg_alpha: float=1,
+                        main_line_color: str='#FF0000', bg_line_color: str='#000000',
+                        gpx_map_line_width: float=2, compass_heading_color: str='#0000FF',
+                        compass_line_width: float=1, compass_axis_fontsize: int=10,
+                        figsize: tuple=None, dpi: float=150) -> tuple:
+    """
+    Renderer class and arguments of a gpx_gauges.GAUGES gauge in the animation style:
+    values in the main line colour, labels and the profile fill in the background line
+    colour, the elevation cursor like the compass heading.
+    """
+    if gauge == 'elevation':
+        return gpx_gauges.ElevationProfileRenderer, dict(
+            resampler=resampler, telemetry=telemetry, bg_color=bg_color, bg_alpha=bg_alpha,
+            line_color=main_line_color, fill_color=bg_line_color, cursor_color=compass_heading_color,
+            line_width=gpx_map_line_width, cursor_width=compass_line_width, fontsize=compass_axis_fontsize,
+            figsize=figsize or gpx_gauges.PROFILE_FIGSIZE, dpi=dpi)
+    if gauge in gpx_gauges.READOUTS:
+        return gpx_gauges.ReadoutRenderer, dict(
+            resampler=resampler, telemetry=telemetry, quantity=gauge, bg_color=bg_color, bg_alpha=bg_alpha,
+            text_color=main_line_color, label_color=bg_line_color,
+            figsize=figsize or gpx_gauges.READOUT_FIGSIZE, dpi=dpi)
+    raise ValueError(f"Unknown gauge {gauge!r}, expected one of {gpx_gauges.GAUGES}")
+
+
+# Options that change how fast an animation renders but not what it looks like
+_UNCACHED_OPTIONS = ('df', 'filename', 'render_workers', 'progress')
+
+
+def cached_gpx_animation(df: pd.DataFrame, cache_dir: str=render_cache.CACHE_DIR,
+                         cache_max_bytes: int=render_cache.CACHE_MAX_BYTES, **kwargs) -> tuple:
+    """
+    ``gpx_animation`` through the render cache, keyed by the track data and every
+    option. Returns the paths of the animations by name: 'map', 'compass' (None without
+    compass) and one per requested gauge.
+    """
+    arguments = inspect.signature(gpx_animation).bind(df, **kwargs)
+    arguments.apply_defaults()
+    options = {name: value for name, value in arguments.arguments.items() if name not in _UNCACHED_OPTIONS}
+    key = render_cache.cache_key('gpx_animation', df, options)
+    entry = render_cache.cached(
+        key, lambda directory: gpx_animation(df, filename=os.path.join(directory, 'gpx_animation'), **kwargs),
+        cache_dir=cache_dir, max_bytes=cache_max_bytes)
+
+    paths = {'map': None, 'compass': None}
+    for name in sorted(os.listdir(entry)):
+        stem = os.path.splitext(name)[0]
+        paths['map' if stem == 'gpx_animation' else stem[len('gpx_animation_'):]] = os.path.join(entry, name)
+    return paths
+
+
+def gpx_overlay_renderer(df: pd.DataFrame, fps: float, size: tuple, overlay: str='map',
+                         bg_color: str='None', bg_alpha: float=1,
+                         main_line_color: str='#FF0000', bg_line_color: str='#000000',
+                         gpx_map_line_width: float=2,
+                         compass_heading_color: str='#0000FF', compass_axis_fontsize: int=10,
+                         compass_line_width: float=1, compass_axis_thickness: float=1):
+    """
+    Renderer for the map, compass or a gpx_gauges.GAUGES gauge drawn directly at ``size``
+    (w, h) pixels, with frames at ``fps`` so they can be pulled by base video time while compositing.
+    """
+    resampler = gpx_resampler.TrackResampler(gpx_resampler.epoch_seconds(df['time']),
+                                             df['latitude'].values, df['longitude'].values, fps=fps)
+    # Keep the layout width of the animation so line widths and fonts scale with the overlay
+    width, height = size
+    layout_width = gpx_gauges.READOUT_FIGSIZE[0] if overlay in gpx_gauges.READOUTS else 10
+    figsize, dpi = (layout_width, layout_width * height / width), width / layout_width
+    if overlay in gpx_gauges.GAUGES:
+        renderer_cls, renderer_kwargs = gauge_renderer_args(
+            overlay, resampler, track_telemetry(df), bg_color=bg_color, bg_alpha=bg_alpha,
+            main_line_color=main_line_color, bg_line_color=bg_line_color,
+            gpx_map_line_width=gpx_map_line_width, compass_heading_color=compass_heading_color,
+            compass_line_width=compass_line_width, compass_axis_fontsize=compass_axis_fontsize,
+            figsize=figsize, dpi=dpi)
+        return renderer_cls(**renderer_kwargs)
+    if overlay == 'compass':
+        return gpx_renderer.CompassStripRenderer(resampler, bg_color, bg_alpha, compass_heading_color,
+                                                 compass_line_width, compass_axis_thickness,
+                                                 compass_axis_fontsize, figsize=figsize, dpi=dpi)
+    return gpx_renderer.RasterTrackRenderer(resampler, bg_color, bg_alpha, main_line_color, bg_line_color,
+                                            gpx_map_line_width, figsize=figsize, dpi=dpi)
+
+
+def gpx_overlay_video(base_video_path: str, df: pd.DataFrame, output_path: str, size: tuple,
+                      overlay: str='map', position: str='Bottom-Right', transparency: float=1.0,
+                      add_gray_box: bool=False, invert_colors: bool=False, style: dict=None,
+                      progress=None) -> str:
+    """Render the GPX overlay straight into the base video (``video_utils.overlay_gpx_direct``)."""
+    fps = video_utils.video_info(base_video_path)['video_fps']
+    renderer = gpx_overlay_renderer(df, fps, size, overlay=overlay, **(style or {}))
+    video_utils.overlay_gpx_direct(base_video_path, renderer, output_path, position, transparency,
+                                   add_gray_box, invert_colors, progress=progress)
+    return output_path
 
     
-def process_gpx_mpl_movpy(filename, fps, num_frames, interval, latitudes, longitudes, 
+def process_gpx_mpl_movpy(filename, fps, num_frames, interval, resampler, 
                         bg_color, bg_alpha,
                         main_line_color, bg_line_color,
                         gpx_map_line_width, compass_heading_color, compass_line_width,
-                        compass_axis_thickness, compass_axis_fontsize, create_compass):
-    
-
-    fig, ax = plt.subplots(figsize=(10, 6), dpi=150, facecolor=bg_color, edgecolor='none')
-    ax.patch.set_alpha(bg_alpha)
-    ax.plot(longitudes, latitudes, color=bg_line_color, lw=gpx_map_line_width)
-    black_line, = ax.plot([], [], color=main_line_color, lw=gpx_map_line_width)
-    ax.axis('off')
-
-    def update(num):
-        black_line.set_data(longitudes[:num], latitudes[:num])
-        return black_line,
-
-    progress_bar = st.progress(0, text=f"Creating Animation with {num_frames} frames...")
-
-    # Save each frame as a transparent PNG image
-    frames = []
-    for frame_num in range(num_frames):
-        update(frame_num)
-        fig.canvas.draw()
-        frame = np.frombuffer(fig.canvas.tostring_rgb(), dtype='uint8')
-        frame = frame.reshape(fig.canvas.get_width_height()[::-1] + (3,))
-        frames.append(frame)
-        progress_bar.progress((frame_num + 1) / num_frames)
-
-    plt.close(fig)
-
-    clip = ImageSequenceClip(frames, fps=fps)
-    clip = clip.set_opacity(bg_alpha)
-    clip.write_gif(filename + '.gif', fps=fps)
+                        compass_axis_thickness, compass_axis_fontsize, create_compass,
+                        progress=streamlit_progress, output_format=video_encoder.DEFAULT_ANIMATION_FORMAT):
+
+    # Frames are rendered on demand and piped into ffmpeg instead of collected in a list
+    extension = video_encoder.animation_format(output_format)[0]
+    progress_bar = progress(f"Creating Animation with {num_frames} frames...")
+    render_video(gpx_renderer.MatplotlibTrackRenderer,
+                 dict(resampler=resampler, bg_color=bg_color, bg_alpha=bg_alpha,
+                      main_line_color=main_line_color, bg_line_color=bg_line_color,
+                      line_width=gpx_map_line_width),
+                 num_frames, filename + extension, fps, progress=progress_bar, output_format=output_format)
 
     if create_compass:
-        latitudes, longitudes = np.array(latitudes), np.array(longitudes)
-        new_df = pd.DataFrame()
-        new_df['latitude'] = latitudes
-        new_df['longitude'] = longitudes
-        df = calculate_bearings(new_df)
-
-        # Create the figure and axis
-        fig1, ax1 = plt.subplots(figsize=(10, 3), dpi=150, facecolor=bg_color, edgecolor='none')
-        ax1.patch.set_alpha(bg_alpha)
-
-        # Directions and angles for compass
-        directions = ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']
-        angles = np.array([0, 45, 90, 135, 180, 225, 270, 315])
-
-        # Set compass limits and ticks
-        ax1.set_xlim([-45, 135])
-        ax1.set_ylim([0, 1])
-        ax1.set_xticks(angles)  # Center the compass around the bearing
-        ax1.set_xticklabels(directions)
-        ax1.tick_params(axis='x', which='major', labelsize=compass_axis_fontsize)
-
-        # Set spine visibility and position
-        ax1.spines['top'].set_position(('outward', -20))
-        ax1.spines['bottom'].set_position(('outward', -20))
-        ax1.spines['left'].set_visible(False)
-        ax1.spines['right'].set_visible(False)
-
-        # Set axis thickness
-        ax1.spines['top'].set_linewidth(compass_axis_thickness)
-        ax1.spines['bottom'].set_linewidth(compass_axis_thickness)
-
-        # Remove y-ticks
-        ax1.set_yticks([])
-
-        # Initialize the bearing line
-        bearing_line, = ax1.plot([], [], color=compass_heading_color, lw=compass_line_width)
-
-        def update(num):
-            bearing = df['bearing'].iloc[num]  # Get the current bearing from the DataFrame
-            if bearing is None:
-                bearing = df['bearing'].iloc[num-1]
-            bearing_line.set_data([bearing, bearing], [0, 1])  # Use a list for x and y positions
-            ax1.set_xlim((bearing - 45) % 360, (bearing + 45) % 360)
-            return bearing_line,
-
-
-        progress_bar = st.progress(0, text=f"Creating Animation with {num_frames} frames...")
-
-        frames = []
-        for frame_num in range(num_frames):
-            update(frame_num)
-            fig1.canvas.draw()
-            frame = np.frombuffer(fig1.canvas.tostring_rgb(), dtype='uint8')
-            frame = frame.reshape(fig1.canvas.get_width_height()[::-1] + (3,))
-            frames.append(frame)
-            progress_bar.progress((frame_num + 1) / num_frames)
-
-        plt.close(fig)
-
-        clip = ImageSequenceClip(frames, fps=fps)
-        clip = clip.set_opacity(bg_alpha)
-        clip.write_gif(filename + '_compass.gif', fps=fps)
-
-
+        progress_bar = progress(f"Creating Compass with {num_frames} frames...")
+        render_video(gpx_renderer.CompassStripRenderer,
+                     dict(resampler=resampler, bg_color=bg_color, bg_alpha=bg_alpha,
+                          heading_color=compass_heading_color, line_width=compass_line_width,
+                          axis_thickness=compass_axis_thickness, axis_fontsize=compass_axis_fontsize),
+                     num_frames, filename + '_compass' + extension, fps, progress=progress_bar,
+                     output_format=output_format)
 
 
-
-
-def process_gpx_mpl_animation(filename, fps, num_frames, interval, latitudes, longitudes, 
+def process_gpx_mpl_animation(filename, fps, num_frames, interval, resampler, 
                               bg_color, bg_alpha,
                               main_line_color, bg_line_color,
                               gpx_map_line_width, compass_heading_color, compass_line_width,
-                              compass_axis_thickness, compass_axis_fontsize, create_compass):
-    
-    fig, ax = plt.subplots(figsize=(10, 6), dpi=150, facecolor=bg_color, edgecolor='none')
-    #fig.patch.set_alpha(0)
-    ax.patch.set_alpha(bg_alpha)
-    ax.plot(longitudes, latitudes, color=bg_line_color, lw=gpx_map_line_width)
-    black_line, = ax.plot([], [], color=main_line_color, lw=gpx_map_line_width)
-    ax.axis('off')
+                              compass_axis_thickness, compass_axis_fontsize, create_compass,
+                              progress=streamlit_progress, output_format=video_encoder.DEFAULT_ANIMATION_FORMAT):
+
+    extension, writer_args = _mpl_writer_args(output_format)
+    fig, ax, black_line = gpx_renderer.track_figure(resampler, bg_color, bg_alpha, main_line_color,
+                                                    bg_line_color, gpx_map_line_width)
 
     def update(num):
-        black_line.set_data(longitudes[:num], latitudes[:num])
-        progress_bar.progress((num + 1) / num_frames)
+        with instrumentation.span('mpl_update'):
+            latitudes, longitudes = resampler.trail(num)
+            black_line.set_data(longitudes, latitudes)
+        instrumentation.count('frames_rendered')
+        progress_bar((num + 1) / num_frames)
         return black_line,
 
-    progress_bar = st.progress(0, text=f"Creating Animation with {num_frames} frames...")
+    progress_bar = progress(f"Creating Animation with {num_frames} frames...")
 
     anim = animation.FuncAnimation(fig, update, frames=num_frames, interval=interval, blit=True)
-    writer = animation.FFMpegWriter(fps=fps, metadata=dict(artist='Me'), extra_args=['-vf', 'format=rgba'])
-    anim.save(filename + '.mov', writer=writer, savefig_kwargs={'transparent': False})
+    writer = animation.FFMpegWriter(fps=fps, metadata=dict(artist='Me'), **writer_args)
+    # matplotlib draws, grabs and pipes each frame itself, so only the whole save is timed
+    with instrumentation.span('mpl_animation_save'):
+        anim.save(filename + extension, writer=writer, savefig_kwargs={'transparent': False})
     plt.close(fig)
 
 
     if create_compass:
 
-        latitudes, longitudes = np.array(latitudes), np.array(longitudes)
-        new_df = pd.DataFrame()
-        new_df['latitude'] = latitudes
-        new_df['longitude'] = longitudes
-        df = calculate_bearings(new_df)
-
-        # Create the figure and axis
-        fig1, ax1 = plt.subplots(figsize=(10, 3), dpi=150, facecolor=bg_color, edgecolor='none')
-        ax1.patch.set_alpha(bg_alpha)
-
-        # Directions and angles for compass
-        directions = ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']
-        angles = np.array([0, 45, 90, 135, 180, 225, 270, 315])
-
-        # Set compass limits and ticks
-        ax1.set_xlim([-45, 135])
-        ax1.set_ylim([0, 1])
-        ax1.set_xticks(angles)  # Center the compass around the bearing
-        ax1.set_xticklabels(directions)
-        ax1.tick_params(axis='x', which='major', labelsize=compass_axis_fontsize)
-
-        # Set spine visibility and position
-        ax1.spines['top'].set_position(('outward', -20))
-        ax1.spines['bottom'].set_position(('outward', -20))
-        ax1.spines['left'].set_visible(False)
-        ax1.spines['right'].set_visible(False)
-
-        # Set axis thickness
-        ax1.spines['top'].set_linewidth(compass_axis_thickness)
-        ax1.spines['bottom'].set_linewidth(compass_axis_thickness)
-
-        # Remove y-ticks
-        ax1.set_yticks([])
-
-        # Initialize the bearing line
-        bearing_line, = ax1.plot([], [], color=compass_heading_color, lw=compass_line_width)
+        fig1, ax1, bearing_line = gpx_renderer.compass_figure(bg_color, bg_alpha, compass_heading_color,
+                                                              compass_line_width, compass_axis_thickness,
+                                                              compass_axis_fontsize)
 
         def update(num):
-            bearing = df['bearing'].iloc[num]  # Get the current bearing from the DataFrame
-            if bearing is None:
-                bearing = df['bearing'].iloc[num-1]
+            bearing = resampler.bearings(num, num + 1)[0]  # Evaluate the heading for this frame only
             bearing_line.set_data([bearing, bearing], [0, 1])  # Use a list for x and y positions
-            ax1.set_xlim((bearing - 45) % 360, (bearing + 45) % 360)
-            progress_bar.progress((num + 1) / num_frames)
+            ax1.set_xlim(gpx_renderer.compass_limits(bearing))
+            instrumentation.count('frames_rendered')
+            progress_bar((num + 1) / num_frames)
             return bearing_line,
 
-        progress_bar = st.progress(0, text=f"Creating Compass with {num_frames} frames...")
+        progress_bar = progress(f"Creating Compass with {num_frames} frames...")
         anim = animation.FuncAnimation(fig1, update, frames=num_frames, interval=interval, blit=True)
-        writer = animation.FFMpegWriter(fps=fps, metadata=dict(artist='Me'), extra_args=['-vf', 'format=rgba'])
-        anim.save(filename + '_compass.mov', writer=writer, savefig_kwargs={'transparent': False})
+        writer = animation.FFMpegWriter(fps=fps, metadata=dict(artist='Me'), **writer_args)
+        with instrumentation.span('mpl_animation_save'):
+            anim.save(filename + '_compass' + extension, writer=writer, savefig_kwargs={'transparent': False})
+
+
+def _mpl_writer_args(output_format) -> tuple:
+    # FFMpegWriter takes the codec separately from the remaining output arguments
+    extension, output_args, _ = video_encoder.animation_format(output_format)
+    args = list(output_args)
+    codec = None
+    if '-vcodec' in args:
+        index = args.index('-vcodec')
+        codec = args[index + 1]
+        del args[index:index + 2]
+    return extension, dict(codec=codec, extra_args=args or None)
+
+
+def render_video(renderer_cls, renderer_kwargs, num_frames, filename, fps, workers=1, progress=None,
+                 output_format=video_encoder.DEFAULT_ANIMATION_FORMAT):
+    _, output_args, with_alpha = video_encoder.animation_format(output_format)
+    if workers > 1:
+        render_pool.render_parallel(renderer_cls, renderer_kwargs, num_frames, filename, fps,
+                                    workers=workers, with_alpha=with_alpha, output_args=output_args,
+                                    progress=progress)
+    else:
+        renderer = renderer_cls(**renderer_kwargs)
+        # Frames unchanged since the previous one are piped again without being copied
+        frames = gpx_renderer.iter_frames(renderer, 0, num_frames, skip_unchanged=True)
+        video_encoder.encode_frames(frames, filename, fps,
+                                    num_frames=num_frames, with_alpha=with_alpha, output_args=output_args,
+                                    progress=progress)
+
+
+def process_gpx_raster(filename, fps, num_frames, resampler,
+                       bg_color, bg_alpha,
+                       main_line_color, bg_line_color,
+                       gpx_map_line_width, compass_heading_color, compass_line_width,
+                       compass_axis_thickness, compass_axis_fontsize, create_compass,
+                       progress=streamlit_progress, workers=1,
+                       output_format=video_encoder.DEFAULT_ANIMATION_FORMAT):
+
+    # Background is rasterised once, each frame only strokes the new part of the track
+    extension = video_encoder.animation_format(output_format)[0]
+    progress_bar = progress(f"Creating Animation with {num_frames} frames...")
+    render_video(gpx_renderer.RasterTrackRenderer,
+                 dict(resampler=resampler, bg_color=bg_color, bg_alpha=bg_alpha,
+                      main_line_color=main_line_color, bg_line_color=bg_line_color,
+                      line_width=gpx_map_line_width),
+                 num_frames, filename + extension, fps, workers=workers, progress=progress_bar,
+                 output_format=output_format)
 
+    if create_compass:
+        progress_bar = progress(f"Creating Compass with {num_frames} frames...")
+        render_video(gpx_renderer.CompassStripRenderer,
+                     dict(resampler=resampler, bg_color=bg_color, bg_alpha=bg_alpha,
+                          heading_color=compass_heading_color, line_width=compass_line_width,
+                          axis_thickness=compass_axis_thickness, axis_fontsize=compass_axis_fontsize),
+                     num_frames, filename + '_compass' + extension, fps, workers=workers,
+                     progress=progress_bar, output_format=output_format)
 
 
 def calculate_bearing(lat1, lon1, lat2, lon2):
@@ -323,12 +384,5 @@ def calculate_bearing(lat1, lon1, lat2, lon2):
     return (degrees(initial_bearing) + 360) % 360
 
 def calculate_bearings(df: pd.DataFrame) -> pd.DataFrame:
-    bearings = []
-    for i in range(1, len(df)):
-        lat1, lon1 = df.iloc[i-1]['latitude'], df.iloc[i-1]['longitude']
-        lat2, lon2 = df.iloc[i]['latitude'], df.iloc[i]['longitude']
-        bearing = calculate_bearing(lat1, lon1, lat2, lon2)
-        bearings.append(bearing)
-    
-    df['bearing'] = [bearings[0]] + bearings
-    return df
\ No newline at end of file
+    df['bearing'] = gpx_kinematics.bearings(df['latitude'].to_numpy(), df['longitude'].to_numpy())
+    return df
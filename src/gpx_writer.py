@@ -0,0 +1,107 @@
+"""
+Streaming GPX writer.
+
+Track points are formatted straight from the column arrays and written in
+chunks, so memory use stays the same however long the track is. Times are
+converted a chunk at a time with NumPy and floats use ``repr``, which round
+trips exactly through ``gpx_parser``.
+"""
+import io
+
+import numpy as np
+
+from . import gpx_parser
+
+GPX_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<gpx version="1.1" creator="gpx_overlay" '
+    'xmlns="http://www.topografix.com/GPX/1/1" '
+    'xmlns:gpxtpx="http://www.garmin.com/xmlschemas/TrackPointExtension/v2">\n'
+)
+DEFAULT_CHUNK_SIZE = 8192
+
+
+def _time_strings(times: np.ndarray) -> list:
+    # Shortest fractional precision that keeps every time in the chunk exact
+    valid = times[times != gpx_parser.NAT]
+    if not np.any(valid % 10**9):
+        unit = 's'
+    elif not np.any(valid % 10**6):
+        unit = 'ms'
+    elif not np.any(valid % 10**3):
+        unit = 'us'
+    else:
+        unit = 'ns'
+    strings = np.datetime_as_string(times.view('M8[ns]'), unit=unit)
+    return [None if time == gpx_parser.NAT else text + 'Z' for time, text in zip(times, strings)]
+
+
+def _column(df, name: str, default, dtype) -> np.ndarray:
+    if name in df:
+        return df[name].to_numpy(dtype=dtype)
+    return np.full(len(df), default, dtype=dtype)
+
+
+def _points(start: int, stop: int, columns: dict, state: dict) -> str:
+    # Python floats, so repr gives the shortest exact text
+    chunk = {name: values[start:stop].tolist() for name, values in columns.items() if name != 'time'}
+    times = _time_strings(columns['time'][start:stop])
+    parts = []
+    for lat, lon, elevation, time, speed, track, segment in zip(
+            chunk['latitude'], chunk['longitude'], chunk['elevation'], times, chunk['speed'],
+            chunk['track'], chunk['segment']):
+        if (track, segment) != state['open']:
+            new_track = state['open'] is None or track != state['open'][0]
+            if state['open'] is not None:
+                parts.append('</trkseg></trk>\n' if new_track else '</trkseg>\n')
+            parts.append('<trk><trkseg>\n' if new_track else '<trkseg>\n')
+            state['open'] = (track, segment)
+
+        parts.append(f'<trkpt lat="{lat!r}" lon="{lon!r}">')
+        if elevation == elevation:  # not NaN
+            parts.append(f'<ele>{elevation!r}</ele>')
+        if time is not None:
+            parts.append(f'<time>{time}</time>')
+        if speed:
+            parts.append(f'<extensions><gpxtpx:TrackPointExtension><gpxtpx:speed>{speed!r}'
+                         f'</gpxtpx:speed></gpxtpx:TrackPointExtension></extensions>')
+        parts.append('</trkpt>\n')
+    return ''.join(parts)
+
+
+def write_gpx(df, output, chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+    """
+    Write the points of a track DataFrame (``gpx_parser.COLUMNS`` layout) as
+    GPX 1.1 to a path or a text/binary file object such as ``io.BytesIO``.
+
+    ``track`` and ``segment`` columns split the output into ``<trk>`` and
+    ``<trkseg>`` elements; without them all points form one segment. Non-zero
+    speeds are kept in a Garmin ``TrackPointExtension``, where ``gpx_parser``
+    reads them back from.
+    """
+    columns = {
+        'latitude': _column(df, 'latitude', np.nan, np.float64),
+        'longitude': _column(df, 'longitude', np.nan, np.float64),
+        'elevation': _column(df, 'elevation', np.nan, np.float64),
+        'time': (df['time'].to_numpy(dtype='datetime64[ns]').view(np.int64) if 'time' in df
+                 else np.full(len(df), gpx_parser.NAT, dtype=np.int64)),
+        'speed': _column(df, 'speed', 0.0, np.float64),
+        'track': _column(df, 'track', 0, np.int64),
+        'segment': _column(df, 'segment', 0, np.int64),
+    }
+
+    if isinstance(output, (str, bytes)) or hasattr(output, '__fspath__'):
+        with open(output, 'w', encoding='utf-8') as f:
+            return write_gpx(df, f, chunk_size)
+    if isinstance(output, io.TextIOBase):
+        write = output.write
+    else:
+        write = lambda text: output.write(text.encode('utf-8'))
+
+    write(GPX_HEADER)
+    state = {'open': None}
+    for start in range(0, len(df), chunk_size):
+        write(_points(start, min(start + chunk_size, len(df)), columns, state))
+    if state['open'] is not None:
+        write('</trkseg></trk>\n')
+    write('</gpx>\n')
@@ -0,0 +1,241 @@
+"""
+Lightweight timing spans and counters for the render pipeline.
+
+Pipeline code marks its stages with ``span(name)`` and counts work with
+``count(name, value)``. Both do nothing unless a ``record()`` block is active,
+so they cost next to nothing outside an instrumented render. A recorder
+keeps, per span name, the number of calls and the total seconds; spans nest,
+so a span's time includes any spans inside it. Worker processes record their
+own spans, which ``merge`` folds into the parent's recorder, so their seconds
+add up CPU-style and can exceed the wall-clock time of the render.
+
+``profile`` wraps a single render in cProfile (or pyinstrument, if installed).
+"""
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILERS = ('cprofile', 'pyinstrument')
+_recorders = []
+_lock = threading.Lock()
+
+
+def _peak_rss_mb(who) -> float:
+    if resource is None:
+        return None
+    kilobytes = 1024 if sys.platform == 'darwin' else 1  # ru_maxrss is bytes on macOS
+    return resource.getrusage(who).ru_maxrss / 1024 / kilobytes
+
+
+class Recorder:
+    """Spans, counters and peak values of one instrumented run."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.spans = {}      # name -> [calls, seconds]
+        self.counters = {}
+        self.peaks = {}      # name -> largest value seen
+        self.seconds = None
+        self._start = time.perf_counter()
+
+    def add_span(self, name: str, seconds: float, calls: int = 1):
+        with _lock:
+            stats = self.spans.setdefault(name, [0, 0.0])
+            stats[0] += calls
+            stats[1] += seconds
+
+    def add_count(self, name: str, value):
+        with _lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_peak(self, name: str, value):
+        if value is not None:
+            with _lock:
+                self.peaks[name] = max(self.peaks.get(name, value), value)
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self._start
+        if resource is not None:
+            # Lifetime peaks of this process and its finished children (ffmpeg), not just this run
+            self.add_peak('peak_rss_mb', _peak_rss_mb(resource.RUSAGE_SELF))
+            self.add_peak('child_peak_rss_mb', _peak_rss_mb(resource.RUSAGE_CHILDREN))
+
+    def summary(self) -> dict:
+        """JSON-serialisable summary; stages are sorted by total time."""
+        seconds = self.seconds if self.seconds is not None else time.perf_counter() - self._start
+        stages = {name: {'calls': calls, 'seconds': round(total, 6), 'ms_per_call': round(1000 * total / calls, 3)}
+                  for name, (calls, total) in sorted(self.spans.items(), key=lambda item: -item[1][1])}
+        summary = {'name': self.name, 'seconds': round(seconds, 6), 'stages': stages,
+                   'counters': dict(self.counters), 'peaks': dict(self.peaks)}
+        frames = self.counters.get('frames_rendered')
+        if frames:
+            summary['ms_per_frame'] = round(1000 * seconds / frames, 3)
+        return summary
+
+    def to_json(self, indent: int = 2) -> str:
+        return json.dumps(self.summary(), indent=indent)
+
+
+@contextmanager
+def record(name: str = 'render'):
+    """Collect the spans and counters of everything run inside the block; yields the ``Recorder``."""
+    recorder = Recorder(name)
+    _recorders.append(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorders.remove(recorder)
+        recorder.finish()
+
+
+def active() -> bool:
+    return bool(_recorders)
+
+
+@contextmanager
+def span(name: str):
+    """Time the block as stage ``name`` in every active recorder."""
+    if not _recorders:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        for recorder in list(_recorders):
+            recorder.add_span(name, elapsed)
+
+
+def count(name: str, value=1):
+    for recorder in list(_recorders):
+        recorder.add_count(name, value)
+
+
+def peak(name: str, value):
+    for recorder in list(_recorders):
+        recorder.add_peak(name, value)
+
+
+def timed_iter(iterable, name: str):
+    """Yield from ``iterable``, timing each step as stage ``name`` (e.g. rendering a frame)."""
+    if not _recorders:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            elapsed = time.perf_counter() - start
+            for recorder in list(_recorders):
+                recorder.add_span(name, elapsed)
+        yield item
+
+
+def merge(summary: dict):
+    """
+    Fold a ``Recorder.summary()`` from a worker process into the active
+    recorders. Spans and counters add up; peaks are kept as ``worker_<name>``.
+    """
+    for name, stage in summary['stages'].items():
+        for recorder in list(_recorders):
+            recorder.add_span(name, stage['seconds'], stage['calls'])
+    for name, value in summary['counters'].items():
+        count(name, value)
+    for name, value in summary['peaks'].items():
+        peak('worker_' + name, value)
+
+
+@contextmanager
+def profile(path: str, profiler: str = 'cprofile'):
+    """
+    Profile the block into ``path``: a pstats file for ``cprofile`` (open it
+    with ``python -m pstats`` or snakeviz), an HTML report for ``pyinstrument``.
+    ``profiler=None`` turns profiling off.
+    """
+    if profiler is None:
+        yield
+        return
+    if profiler == 'cprofile':
+        import cProfile
+        session = cProfile.Profile()
+        session.enable()
+        try:
+            yield
+        finally:
+            session.disable()
+            session.dump_stats(path)
+    elif profiler == 'pyinstrument':
+        try:
+            import pyinstrument
+        except ImportError:
+            raise ImportError("pyinstrument is not installed; pip install pyinstrument or use cProfile")
+        session = pyinstrument.Profiler()
+        session.start()
+        try:
+            yield
+        finally:
+            session.stop()
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(session.output_html())
+    else:
+        raise ValueError(f"Unknown profiler {profiler!r}, expected one of {PROFILERS}")
+
+
+def profile_path(name: str, profiler: str, directory: str = None) -> str:
+    """File for the profile of render ``name`` (in the temp directory by default); None when profiling is off."""
+    if profiler is None:
+        return None
+    return os.path.join(directory or tempfile.gettempdir(), f"{name}.{'prof' if profiler == 'cprofile' else 'html'}")
+
+
+def profile_report(path: str, limit: int = 25) -> str:
+    """The ``limit`` most expensive functions (by cumulative time) of a cProfile dump, as text."""
+    import pstats
+    stream = io.StringIO()
+    pstats.Stats(path, stream=stream).sort_stats('cumulative').print_stats(limit)
+    return stream.getvalue()
+
+
+def streamlit_profiler(key: str) -> str:
+    """Sidebar choice of profiler for the next render (imported lazily for headless use)."""
+    import streamlit as st
+    choice = st.sidebar.selectbox("Profile Next Render", ['Off', 'cProfile', 'pyinstrument'], key=key)
+    return None if choice == 'Off' else choice.lower()
+
+
+def streamlit_summary(summary: dict, profile_path: str = None, key: str = 'render_metrics'):
+    """Summary panel for a recorded render, with JSON (and profile) downloads."""
+    import streamlit as st
+    with st.expander(f"Render Metrics: {summary['seconds']:.2f} s", expanded=False):
+        columns = st.columns(4)
+        columns[0].metric("Total", f"{summary['seconds']:.2f} s")
+        columns[1].metric("Frames", f"{summary['counters'].get('frames_rendered', 0):,}")
+        if 'ms_per_frame' in summary:
+            columns[2].metric("ms / Frame", f"{summary['ms_per_frame']:.1f}")
+        if summary['peaks'].get('peak_rss_mb') is not None:
+            columns[3].metric("Peak RSS", f"{summary['peaks']['peak_rss_mb']:,.0f} MB")
+        st.table([{'stage': name, **stage} for name, stage in summary['stages'].items()])
+        if summary['counters']:
+            st.json(summary['counters'])
+        st.download_button("Download Metrics JSON", json.dumps(summary, indent=2), f"{key}.json",
+                           mime='application/json', key=f'{key}_json')
+        if profile_path is not None and os.path.exists(profile_path):
+            if profile_path.endswith('.prof'):
+                st.code(profile_report(profile_path))
+            with open(profile_path, 'rb') as f:
+                st.download_button("Download Profile", f, os.path.basename(profile_path), key=f'{key}_profile')
@@ -0,0 +1,116 @@
+"""
+Content-addressed disk cache for rendered animations and composites.
+
+Each entry is a directory named after a hash of everything that determines
+the render (track data, input files and every styling parameter), holding
+the files the render wrote. Entries are created atomically by renaming a
+finished temporary directory, so a crashed or concurrent render never leaves
+a half-written entry behind. The directory mtime records the last use; when
+the cache grows past its budget the least recently used entries are removed.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+from . import instrumentation
+
+CACHE_DIR = os.environ.get('GPX_OVERLAY_CACHE_DIR', 'render_cache')
+CACHE_MAX_BYTES = int(os.environ.get('GPX_OVERLAY_CACHE_MAX_BYTES', 5 * 2**30))
+# Bump when rendering changes, so entries made by older code are not reused
+CACHE_VERSION = 1
+_TMP_PREFIX = '.tmp_'
+
+
+def _update(digest, value):
+    if isinstance(value, pd.DataFrame):
+        digest.update(repr(list(value.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=False).values.tobytes())
+    elif isinstance(value, dict):
+        for name in sorted(value):
+            digest.update(repr(name).encode())
+            _update(digest, value[name])
+    elif isinstance(value, (list, tuple)):
+        digest.update(f'{type(value).__name__}{len(value)}'.encode())
+        for item in value:
+            _update(digest, item)
+    else:
+        digest.update(repr(value).encode())
+    digest.update(b'\0')
+
+
+def file_fingerprint(path: str) -> tuple:
+    """
+    Stand-in for a file's content in a cache key: path, size and modification
+    time, so multi-GB videos are not read just to look up a render.
+    """
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+
+def cache_key(*parts) -> str:
+    """Hex digest over DataFrames, dicts, sequences and plain values (by ``repr``)."""
+    digest = hashlib.sha256(f'v{CACHE_VERSION}'.encode())
+    for part in parts:
+        _update(digest, part)
+    return digest.hexdigest()
+
+
+def _entry_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+def evict(cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES, keep: str = None) -> list:
+    """Remove least recently used entries until the cache fits ``max_bytes``; returns removed keys."""
+    if not os.path.isdir(cache_dir):
+        return []
+    entries = []
+    for key in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, key)
+        if key.startswith(_TMP_PREFIX) or not os.path.isdir(path):
+            continue
+        entries.append((os.path.getmtime(path), key, _entry_size(path)))
+    total = sum(size for _, _, size in entries)
+    removed = []
+    for _, key, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if key == keep:
+            continue
+        shutil.rmtree(os.path.join(cache_dir, key), ignore_errors=True)
+        total -= size
+        removed.append(key)
+    return removed
+
+
+def cached(key: str, render, cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES) -> str:
+    """
+    Directory holding the artifacts for ``key``, calling ``render(directory)``
+    to write them into a fresh directory on a miss. Hits only mark the entry
+    as recently used.
+    """
+    entry = os.path.join(cache_dir, key)
+    if os.path.isdir(entry):
+        os.utime(entry)
+        instrumentation.count('cache_hits')
+        return entry
+    instrumentation.count('cache_misses')
+
+    os.makedirs(cache_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=_TMP_PREFIX, dir=cache_dir)
+    try:
+        render(work_dir)
+        try:
+            os.rename(work_dir, entry)
+        except OSError:
+            # Another render of the same key finished first; keep that one
+            if not os.path.isdir(entry):
+                raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    os.utime(entry)
+    evict(cache_dir, max_bytes, keep=key)
+    return entry
@@ -0,0 +1,213 @@
+"""
+Background render jobs for the Streamlit pages.
+
+Renders are submitted to a process pool that lives as long as the Streamlit
+server, so a job keeps running across script reruns and its handle can sit
+in ``st.session_state``. At most ``MAX_RENDERS`` jobs render at once on a
+host; later ones wait in the queue. Each job reports progress through the
+usual ``progress(text) -> callback(fraction)`` factory, throttled to one
+update per ``PROGRESS_INTERVAL`` seconds, and the same callback raises
+``RenderCancelled`` once the job has been cancelled, which unwinds the
+render (and its ffmpeg process) from inside.
+
+Every browser session also gets its own output directory, so uploads and
+results of different users never overwrite each other.
+"""
+import multiprocessing
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+
+from . import instrumentation
+
+MAX_RENDERS = int(os.environ.get('GPX_OVERLAY_MAX_RENDERS', 2))
+SESSION_ROOT = os.environ.get('GPX_OVERLAY_SESSION_DIR', 'sessions')
+SESSION_MAX_AGE = int(os.environ.get('GPX_OVERLAY_SESSION_MAX_AGE', 24 * 3600))  # seconds
+PROGRESS_INTERVAL = 0.5
+_runner = None
+
+
+class RenderCancelled(Exception):
+    pass
+
+
+def _throttled_progress(state, cancel):
+    def progress(text):
+        last = [0.0]
+
+        def update(fraction):
+            now = time.monotonic()
+            if fraction < 1 and now - last[0] < PROGRESS_INTERVAL:
+                return
+            last[0] = now
+            if cancel.is_set():
+                raise RenderCancelled()
+            state.update(fraction=min(max(fraction, 0.0), 1.0), text=text)
+
+        state.update(fraction=0.0, text=text)
+        return update
+    return progress
+
+
+def _run(name, func, args, kwargs, state, cancel, profile_path, profiler):
+    if cancel.is_set():
+        raise RenderCancelled()
+    state.update(state='running', text=f"{name}...")
+    with instrumentation.record(name) as recorder, instrumentation.profile(profile_path, profiler):
+        result = func(*args, progress=_throttled_progress(state, cancel), **kwargs)
+    return result, recorder.summary()
+
+
+class RenderJob:
+    """Handle of a submitted render; cheap to poll from every rerun."""
+
+    def __init__(self, name, future, state, cancel, profile_path=None):
+        self.name = name
+        self.profile_path = profile_path
+        self._future = future
+        self._state = state
+        self._cancel = cancel
+
+    def status(self) -> str:
+        """'queued', 'running', 'done', 'failed' or 'cancelled'."""
+        if not self._future.done():
+            return self._state['state']
+        if self._future.cancelled() or isinstance(self._future.exception(), RenderCancelled):
+            return 'cancelled'
+        return 'failed' if self._future.exception() is not None else 'done'
+
+    def finished(self) -> bool:
+        return self._future.done()
+
+    def progress(self) -> tuple:
+        """Completed fraction and description of the current step."""
+        if self._future.done():
+            return 1.0, self.name
+        return self._state['fraction'], self._state['text']
+
+    def cancel(self):
+        if not self._future.cancel():
+            self._cancel.set()
+
+    def error(self) -> BaseException:
+        try:
+            return self._future.exception(timeout=0)
+        except CancelledError:
+            return None
+
+    def result(self):
+        """The render function's return value; raises its exception if it failed."""
+        return self._future.result()[0]
+
+    def metrics(self) -> dict:
+        """``instrumentation`` summary of the render."""
+        return self._future.result()[1]
+
+
+class JobRunner:
+    """Process pool running at most ``max_renders`` renders at a time."""
+
+    def __init__(self, max_renders: int = MAX_RENDERS):
+        context = multiprocessing.get_context('spawn')
+        self._manager = context.Manager()
+        self._pool = ProcessPoolExecutor(max_workers=max_renders, mp_context=context)
+
+    def submit(self, name: str, func, *args, profile_path: str = None, profiler: str = None,
+               **kwargs) -> RenderJob:
+        """
+        Run ``func(*args, progress=..., **kwargs)`` in the background. ``func``
+        and its arguments must be picklable (module-level functions, plain data).
+        With a ``profiler`` the render is profiled into ``profile_path``
+        (see ``instrumentation.profile``).
+        """
+        state = self._manager.dict(state='queued', fraction=0.0, text="Waiting for a free render slot...")
+        cancel = self._manager.Event()
+        future = self._pool.submit(_run, name, func, args, kwargs, state, cancel, profile_path, profiler)
+        return RenderJob(name, future, state, cancel, profile_path if profiler else None)
+
+    def shutdown(self):
+        self._pool.shutdown(cancel_futures=True)
+        self._manager.shutdown()
+
+
+def runner() -> JobRunner:
+    """The host-wide job runner, started on first use."""
+    global _runner
+    if _runner is None:
+        _runner = JobRunner()
+    return _runner
+
+
+def submit(name: str, func, *args, **kwargs) -> RenderJob:
+    """``JobRunner.submit`` on the host-wide runner."""
+    return runner().submit(name, func, *args, **kwargs)
+
+
+def cleanup_sessions(root: str = SESSION_ROOT, max_age: float = SESSION_MAX_AGE) -> list:
+    """Remove session directories unused for ``max_age`` seconds; returns their names."""
+    if not os.path.isdir(root):
+        return []
+    removed = []
+    cutoff = time.time() - max_age
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(name)
+    return removed
+
+
+def session_dir(session_id: str, root: str = SESSION_ROOT) -> str:
+    """Output directory of one session, marked as used."""
+    path = os.path.join(root, session_id)
+    os.makedirs(path, exist_ok=True)
+    os.utime(path)
+    return path
+
+
+def streamlit_session_dir() -> str:
+    """Output directory of the current Streamlit session (imported lazily)."""
+    import streamlit as st
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+        cleanup_sessions()
+    return session_dir(st.session_state.session_id)
+
+
+def streamlit_session_path(name: str) -> str:
+    return os.path.join(streamlit_session_dir(), name)
+
+
+def streamlit_job(job: RenderJob, key: str) -> bool:
+    """
+    Progress bar and cancel button while ``job`` runs, refreshed every
+    ``PROGRESS_INTERVAL`` seconds without rerunning the page; the whole page
+    reruns once the job finishes. Afterwards shows the job's metrics, or why
+    it did not finish. Returns True when the job's result is ready.
+    """
+    import streamlit as st
+    if job.finished():
+        status = job.status()
+        if status == 'done':
+            instrumentation.streamlit_summary(job.metrics(), job.profile_path, key=f'{key}_metrics')
+            return True
+        if status == 'cancelled':
+            st.info(f"{job.name} was cancelled")
+        else:
+            st.error(f"{job.name} failed: {job.error()}")
+        return False
+
+    @st.fragment(run_every=PROGRESS_INTERVAL)
+    def panel():
+        if job.finished():
+            st.rerun(scope='app')
+        fraction, text = job.progress()
+        st.progress(fraction, text=text)
+        if st.button("Cancel", key=f'{key}_cancel'):
+            job.cancel()
+            st.info("Cancelling...")
+
+    panel()
+    return False
@@ -0,0 +1,128 @@
+"""
+Parallel chunked rendering.
+
+The frame range is split into chunks; each chunk is rendered and encoded by a
+worker process with its own renderer, rebuilt from the (picklable) resampler
+and style arguments. The chunk files are then joined with an ffmpeg concat
+stream copy, so nothing is re-encoded.
+"""
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from . import gpx_renderer, video_encoder, instrumentation
+
+MIN_CHUNK_FRAMES = 100
+CHUNKS_PER_WORKER = 4
+POLL_INTERVAL = 0.5  # seconds between progress calls while chunks render
+
+
+def default_workers() -> int:
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def frame_chunks(num_frames: int, workers: int) -> list:
+    """Split ``range(num_frames)`` into ``(start, stop)`` chunks, a few per worker."""
+    chunk_size = max(MIN_CHUNK_FRAMES, -(-num_frames // (workers * CHUNKS_PER_WORKER)))
+    return [(start, min(start + chunk_size, num_frames)) for start in range(0, num_frames, chunk_size)]
+
+
+def _render_chunk(renderer_cls, renderer_kwargs, start, stop, chunk_path, fps, with_alpha, output_args,
+                  instrument=False):
+    # Spans recorded here are returned to the parent, which merges them into its recorder
+    with instrumentation.record('chunk') as recorder:
+        with instrumentation.span('renderer_setup'):
+            renderer = renderer_cls(**renderer_kwargs)
+        frames = gpx_renderer.iter_frames(renderer, start, stop, skip_unchanged=True)
+        video_encoder.encode_frames(frames, chunk_path, fps, with_alpha=with_alpha, output_args=output_args)
+    return stop - start, recorder.summary() if instrument else None
+
+
+def _terminate(pool: ProcessPoolExecutor):
+    # ProcessPoolExecutor has no public way to stop running tasks before Python 3.14
+    processes = list((pool._processes or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+
+
+def run_chunks(func, chunk_args: list, workers: int, num_frames: int, progress=None) -> None:
+    """
+    Run ``func(*args)`` for every tuple in ``chunk_args`` on a pool of
+    ``workers`` spawned processes. ``func`` returns the number of frames it
+    rendered and its ``instrumentation`` summary (or None), which is merged
+    into the active recorders.
+
+    ``progress`` gets the completed fraction every ``POLL_INTERVAL`` seconds,
+    not only when a chunk finishes. If it raises (a cancelled render job), or
+    a chunk fails, the pending chunks are dropped and the worker processes
+    terminated instead of waiting for them; their ffmpeg processes exit once
+    their input closes.
+    """
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        pending = {pool.submit(func, *args) for args in chunk_args}
+        done = 0
+        while pending:
+            finished, pending = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in finished:
+                frames, summary = future.result()
+                done += frames
+                if summary is not None:
+                    instrumentation.merge(summary)
+            if progress is not None:
+                progress(done / num_frames)
+    except BaseException:
+        _terminate(pool)
+        raise
+    pool.shutdown()
+
+
+def concat_videos(paths: list, filename: str) -> None:
+    """Join videos with identical stream parameters without re-encoding."""
+    list_path = filename + '.concat.txt'
+    with open(list_path, 'w') as f:
+        for path in paths:
+            f.write(f"file '{os.path.abspath(path)}'\n")
+    try:
+        result = subprocess.run([video_encoder.ffmpeg_binary(), '-y', '-loglevel', 'error',
+                                 '-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', filename],
+                                capture_output=True)
+    finally:
+        os.remove(list_path)
+    if result.returncode != 0:
+        raise IOError(f"ffmpeg concat failed for {filename}: {result.stderr.decode(errors='replace').strip()}")
+
+
+def render_parallel(renderer_cls, renderer_kwargs: dict, num_frames: int, filename: str, fps: float,
+                    workers: int = None, with_alpha: bool = False, output_args: list = None,
+                    progress=None) -> None:
+    """
+    Render frames ``0`` to ``num_frames - 1`` of ``renderer_cls(**renderer_kwargs)``
+    into ``filename`` using a pool of ``workers`` processes.
+
+    Every worker seeks its renderer to the chunk start the same way the serial
+    path gets there, so the rendered frames are identical to a serial render.
+    With a lossless codec in ``output_args`` the decoded output is identical
+    too; with lossy codecs only the encoder's rate control differs at chunk
+    boundaries.
+    """
+    workers = workers or default_workers()
+    chunks = frame_chunks(num_frames, workers)
+    extension = os.path.splitext(filename)[1]
+    chunk_dir = tempfile.mkdtemp(prefix='chunks_', dir=os.path.dirname(os.path.abspath(filename)))
+    chunk_paths = [os.path.join(chunk_dir, f'{index:05d}{extension}') for index in range(len(chunks))]
+    try:
+        run_chunks(_render_chunk, [(renderer_cls, renderer_kwargs, start, stop, path, fps, with_alpha, output_args,
+                                    instrumentation.active())
+                                   for (start, stop), path in zip(chunks, chunk_paths)],
+                   workers, num_frames, progress=progress)
+        with instrumentation.span('concat'):
+            concat_videos(chunk_paths, filename)
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
@@ -0,0 +1,79 @@
+"""
+On-disk columnar store of parsed GPX tracks.
+
+A GPX file is parsed once and its columns saved as one ``.npy`` file each, in
+a store entry named after a hash of the file's bytes. Later loads of the same
+file, from a rerun, another browser session or a batch worker, reopen the
+columns memory-mapped instead of parsing again, so they share the pages of
+the OS file cache rather than each holding its own copy. Entries are created
+and evicted like render cache entries (atomically, least recently used first).
+
+The mapped columns are read-only; operations that modify a DataFrame copy
+the affected columns as usual. Only ``time`` is copied on load, because
+pandas cannot attach a UTC timezone to an array without copying it.
+"""
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import gpx_parser, render_cache, instrumentation
+
+STORE_DIR = os.environ.get('GPX_OVERLAY_TRACK_STORE_DIR', 'track_store')
+STORE_MAX_BYTES = int(os.environ.get('GPX_OVERLAY_TRACK_STORE_MAX_BYTES', 2**30))
+# Bump when the parser or the column layout changes
+STORE_VERSION = 1
+_BLOCK_SIZE = 2**20
+
+
+def content_hash(gpx_file) -> str:
+    """SHA-1 of a GPX document given as a path, raw XML or a file object (which is rewound)."""
+    source = gpx_parser.open_source(gpx_file)
+    digest = hashlib.sha1()
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(_BLOCK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    for block in iter(lambda: source.read(_BLOCK_SIZE), source.read(0)):
+        digest.update(block.encode('utf-8') if isinstance(block, str) else block)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return digest.hexdigest()
+
+
+def write_columns(columns: dict, directory: str) -> None:
+    for name in gpx_parser.COLUMNS:
+        np.save(os.path.join(directory, f'{name}.npy'), columns[name])
+
+
+def read_columns(directory: str) -> dict:
+    """Columns of a store entry, memory-mapped read-only."""
+    columns = {}
+    for name in gpx_parser.COLUMNS:
+        path = os.path.join(directory, f'{name}.npy')
+        try:
+            # A plain ndarray over the mapping, so pandas and NumPy results are not np.memmap
+            columns[name] = np.asarray(np.load(path, mmap_mode='r'))
+        except ValueError:
+            columns[name] = np.load(path)  # An empty array cannot be mapped
+    return columns
+
+
+def open_track(gpx_file, store_dir: str = STORE_DIR, max_bytes: int = STORE_MAX_BYTES) -> pd.DataFrame:
+    """
+    Track DataFrame (``gpx_parser.columns_to_dataframe`` layout) of a GPX
+    document, parsed on the first load and memory-mapped from the store after.
+    """
+    key = render_cache.cache_key('track_store', STORE_VERSION, content_hash(gpx_file))
+
+    def parse(directory):
+        with instrumentation.span('parse_gpx'):
+            write_columns(gpx_parser.read_gpx_columns(gpx_file), directory)
+
+    entry = render_cache.cached(key, parse, cache_dir=store_dir, max_bytes=max_bytes)
+    with instrumentation.span('open_track'):
+        df = gpx_parser.columns_to_dataframe(read_columns(entry))
+    instrumentation.count('gpx_points', len(df))
+    return df
@@ -0,0 +1,83 @@
+"""
+Content-addressed store of uploaded files.
+
+Streamlit keeps an upload in memory and hands the same object to every
+rerun. ``ingest`` hashes it in chunks and only writes it to disk when no
+upload with the same content is stored yet, in chunks into a temporary
+directory that is renamed into place (the same atomic creation and least
+recently used eviction as the render cache). The returned path depends only
+on the content, so render cache keys, probes and thumbnails of it stay valid
+across reruns, sessions and repeated uploads of the same file.
+
+Stored files are shared between sessions and must not be modified.
+"""
+import hashlib
+import os
+
+from . import render_cache, instrumentation
+
+UPLOAD_DIR = os.environ.get('GPX_OVERLAY_UPLOAD_DIR', 'uploads')
+UPLOAD_MAX_BYTES = int(os.environ.get('GPX_OVERLAY_UPLOAD_MAX_BYTES', 20 * 2**30))
+CHUNK_SIZE = 8 * 2**20
+
+
+def _chunks(upload):
+    # Slices of the upload's own buffer where it has one, so nothing is copied
+    if hasattr(upload, 'getbuffer'):
+        buffer = upload.getbuffer()
+        for start in range(0, len(buffer), CHUNK_SIZE):
+            yield buffer[start:start + CHUNK_SIZE]
+        return
+    if isinstance(upload, (bytes, bytearray, memoryview)):
+        buffer = memoryview(upload)
+        for start in range(0, len(buffer), CHUNK_SIZE):
+            yield buffer[start:start + CHUNK_SIZE]
+        return
+    upload.seek(0)
+    yield from iter(lambda: upload.read(CHUNK_SIZE), b'')
+    upload.seek(0)
+
+
+def content_hash(upload) -> str:
+    """SHA-1 of an upload (a Streamlit ``UploadedFile``, binary file object or bytes)."""
+    digest = hashlib.sha1()
+    with instrumentation.span('upload_hash'):
+        for chunk in _chunks(upload):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def ingest(upload, name: str = None, store_dir: str = UPLOAD_DIR, max_bytes: int = UPLOAD_MAX_BYTES) -> str:
+    """
+    Path of the stored copy of ``upload``, writing it only if its content is
+    not stored yet. The file keeps the extension of ``name`` (by default the
+    upload's own ``name``), which ffmpeg uses to pick the demuxer.
+    """
+    name = name if name is not None else getattr(upload, 'name', '')
+    extension = os.path.splitext(name)[1].lower()
+    digest = content_hash(upload)
+
+    def write(directory):
+        with instrumentation.span('upload_write'), open(os.path.join(directory, digest + extension), 'wb') as f:
+            for chunk in _chunks(upload):
+                f.write(chunk)
+                instrumentation.count('upload_bytes_written', len(chunk))
+
+    entry = render_cache.cached(render_cache.cache_key('upload', digest, extension), write,
+                                cache_dir=store_dir, max_bytes=max_bytes)
+    return os.path.join(entry, digest + extension)
+
+
+def streamlit_ingest(upload) -> str:
+    """
+    ``ingest`` memoised per Streamlit upload (its ``file_id``), so reruns with
+    the same upload neither hash nor write it again.
+    """
+    import streamlit as st
+    paths = st.session_state.setdefault('upload_paths', {})
+    path = paths.get(upload.file_id)
+    if path is None or not os.path.exists(path):
+        path = paths[upload.file_id] = ingest(upload)
+    else:
+        os.utime(os.path.dirname(path))  # keep it recently used for eviction
+    return path
@@ -1,8 +1,10 @@
 # video_cropper.py
 import streamlit as st
-import moviepy.editor as mp
 import os
-from . import video_utils
+from . import video_utils, video_probe, render_jobs, upload_store
+
+# st.video reads and hashes the whole file on every rerun, so larger uploads only get thumbnails
+PLAYER_MAX_BYTES = 200 * 2**20
 
 def video_cropper():
     st.header("Video Cropper")
@@ -11,36 +13,70 @@ def video_cropper():
     duration = st.text_input("Enter desired duration (in seconds)", value="", type="default")
     
     if uploaded_file is not None:
-        video_path = os.path.join("temp_video.mp4")
-        with open(video_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        # Stored once per content, not on every rerun, so a running crop never reads a half-written file
+        video_path = upload_store.streamlit_ingest(uploaded_file)
         
-        video = mp.VideoFileClip(video_path)
-        duration = int(video.duration)
-        st.session_state['video_fps'] = video.fps
+        # Container metadata only; probed once per upload and cached
+        info = video_probe.probe(video_path)
+        duration = int(info['duration'])
+        st.session_state['video_fps'] = info['video_fps']
         
-        st.video(video_path)
+        if os.path.getsize(video_path) <= PLAYER_MAX_BYTES:
+            st.video(video_path)
         st.write(f"Video Duration: {duration} seconds")
         st.write(f"Video FPS: {st.session_state.video_fps}")
+        width, height = info['display_size']
+        st.write(f"Resolution: {width}x{height} ({info['video_codec']}"
+                 + (f", rotated {info['video_rotation']}°)" if info['video_rotation'] else ")"))
         
         start_time, end_time = st.slider(
             "Select range",
             0, duration, (0, duration),
             format="%d seconds"
         )
+        start_column, end_column = st.columns(2)
+        start_column.image(video_probe.thumbnail(video_path, start_time), caption=f"Start ({start_time} s)")
+        end_frame = video_probe.thumbnail(video_path, end_time)
+        if end_frame is None:  # the range ends on the video's last, partial second
+            end_frame = video_probe.thumbnail(video_path, max(info['duration'] - 1 / info['video_fps'], 0))
+        end_column.image(end_frame, caption=f"End ({end_time} s)")
         
+        fast_crop = st.checkbox("Fast crop (no re-encode, starts on the nearest earlier keyframe)", value=True)
+        exact_start = st.checkbox("Frame-exact crop (re-encodes the partial GOPs at either end)", disabled=not fast_crop)
+
         if st.button("Crop Video"):
-            cropped_video_path = "cropped_video.mp4"
-            cropped_duration = video_utils.crop_video(video_path, start_time, end_time, cropped_video_path)
-            st.session_state['cropped_video_duration'] = cropped_duration
-            st.session_state['cropped_video_path'] = cropped_video_path
+            cropped_video_path = render_jobs.streamlit_session_path("cropped_video.mp4")
+            if fast_crop:
+                st.session_state.crop_job = render_jobs.submit('Video crop', video_utils.crop_video_fast, video_path,
+                                                               start_time, end_time, cropped_video_path,
+                                                               exact_start=exact_start)
+            else:
+                st.session_state.crop_job = render_jobs.submit('Video crop', video_utils.crop_video, video_path,
+                                                               start_time, end_time, cropped_video_path)
+            st.session_state.crop_job_output = cropped_video_path
+            st.session_state.crop_job_stored = False
+
+        job = st.session_state.get('crop_job')
+        if job is not None and render_jobs.streamlit_job(job, 'crop_job'):
+            cropped_video_path = st.session_state.crop_job_output
+            result = job.result()
+            if isinstance(result, tuple):
+                cut_start, cut_end = result
+                st.write(f"Cut from {cut_start:.2f} to {cut_end:.2f} seconds")
+                cropped_duration = cut_end - cut_start
+            else:
+                cropped_duration = result
+            # Stored once, so a later "Store Video Info" is not overwritten on the next rerun
+            if not st.session_state.crop_job_stored:
+                st.session_state['cropped_video_duration'] = cropped_duration
+                st.session_state['cropped_video_path'] = cropped_video_path
+                st.session_state['video_cropped_duration_seconds'] = cropped_duration
+                st.session_state.crop_job_stored = True
             st.success("Video cropped successfully!")
             st.video(cropped_video_path)
-            st.session_state['video_cropped_duration_seconds'] = cropped_duration
-            st.session_state.cropped_video_path = cropped_video_path
             
             with open(cropped_video_path, "rb") as f:
-                st.download_button("Download Cropped Video", f, cropped_video_path)
+                st.download_button("Download Cropped Video", f, os.path.basename(cropped_video_path))
         
         if st.button("Store Video Info"):
             st.session_state['cropped_video_duration'] = duration
@@ -0,0 +1,136 @@
+"""
+Streaming frame encoder.
+
+Frames produced by a generator are piped into an ffmpeg subprocess through a
+bounded queue, so only a handful of frames are ever held in memory no matter
+how long the animation is.
+"""
+import os
+import queue
+import subprocess
+import threading
+
+import numpy as np
+from moviepy.config import get_setting
+
+from . import instrumentation
+
+# Output arguments per container, keyed by file extension
+OUTPUT_ARGS = {
+    '.gif': [],
+    '.mov': ['-vcodec', 'libx264', '-pix_fmt', 'yuv420p'],
+    '.mp4': ['-vcodec', 'libx264', '-pix_fmt', 'yuv420p'],
+}
+# Intermediate formats for rendered animations: (extension, output arguments, keeps alpha).
+# QuickTime RLE only stores the runs that change, which suits mostly-empty overlay
+# frames; see benchmarks/bench_formats.py for encode/decode speed and size.
+ANIMATION_FORMATS = {
+    'qtrle': ('.mov', ['-vcodec', 'qtrle', '-pix_fmt', 'argb'], True),
+    'png': ('.mov', ['-vcodec', 'png', '-pix_fmt', 'rgba'], True),
+    'h264': ('.mov', ['-vcodec', 'libx264', '-pix_fmt', 'yuv420p'], False),
+    'gif': ('.gif', [], False),
+}
+DEFAULT_ANIMATION_FORMAT = 'qtrle'
+DEFAULT_QUEUE_SIZE = 8
+_DONE = object()
+
+
+def ffmpeg_binary() -> str:
+    return get_setting("FFMPEG_BINARY")
+
+
+def animation_format(name: str) -> tuple:
+    """``(extension, output_args, with_alpha)`` of an ``ANIMATION_FORMATS`` entry."""
+    if name not in ANIMATION_FORMATS:
+        raise ValueError(f"Unknown animation format {name!r}, expected one of {list(ANIMATION_FORMATS)}")
+    return ANIMATION_FORMATS[name]
+
+
+def ffmpeg_command(filename: str, size: tuple, fps: float, pix_fmt: str = 'rgb24',
+                   output_args: list = None) -> list:
+    """ffmpeg command line that reads raw frames of ``size`` (w, h) from stdin."""
+    if output_args is None:
+        output_args = OUTPUT_ARGS.get(filename[filename.rfind('.'):].lower(), [])
+    return [ffmpeg_binary(), '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-vcodec', 'rawvideo', '-s', f'{size[0]}x{size[1]}',
+            '-pix_fmt', pix_fmt, '-r', f'{fps}', '-i', '-',
+            *output_args, filename]
+
+
+def _pipe_frames(frame_queue: queue.Queue, stdin, errors: list):
+    while True:
+        data = frame_queue.get()
+        if data is _DONE:
+            return
+        try:
+            stdin.write(data)
+        except (BrokenPipeError, OSError) as error:
+            errors.append(error)
+            # Keep draining so the producer never blocks on a full queue
+            while frame_queue.get() is not _DONE:
+                pass
+            return
+
+
+def encode_frames(frames, filename: str, fps: float, num_frames: int = None, with_alpha: bool = False,
+                  output_args: list = None, queue_size: int = DEFAULT_QUEUE_SIZE, progress=None) -> int:
+    """
+    Encode an iterable of RGB(A) ``uint8`` frames into ``filename``.
+
+    Rendering runs in the calling thread while a writer thread feeds ffmpeg,
+    with at most ``queue_size`` frames waiting in between. Frames are copied
+    as they are queued, so renderers may reuse their buffers. A None frame
+    repeats the previous one without copying it again (see
+    ``gpx_renderer.iter_frames``); the first frame must not be None. ``progress`` is
+    called with the completed fraction when ``num_frames`` is known. Returns
+    the number of frames written.
+    """
+    frame_queue = queue.Queue(maxsize=queue_size)
+    errors = []
+    process = None
+    writer = None
+    count = 0
+    data = None
+    try:
+        for frame in instrumentation.timed_iter(frames, 'render_frame'):
+            if frame is None:
+                if data is None:
+                    raise ValueError("The first frame to encode is None")
+                # Queued bytes are never modified, so the previous frame's are piped again as they are
+                instrumentation.count('frames_repeated')
+            else:
+                if not with_alpha:
+                    frame = frame[:, :, :3]
+                if process is None:
+                    height, width = frame.shape[:2]
+                    command = ffmpeg_command(filename, (width, height), fps,
+                                             pix_fmt='rgba' if with_alpha else 'rgb24', output_args=output_args)
+                    process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+                    writer = threading.Thread(target=_pipe_frames, args=(frame_queue, process.stdin, errors),
+                                              daemon=True)
+                    writer.start()
+                with instrumentation.span('frame_copy'):
+                    data = np.ascontiguousarray(frame, dtype=np.uint8).tobytes()
+            if errors:
+                break
+            # Time spent here is the renderer waiting on ffmpeg
+            with instrumentation.span('encode_wait'):
+                frame_queue.put(data)
+            instrumentation.count('frames_rendered')
+            instrumentation.count('bytes_piped', len(data))
+            count += 1
+            if progress is not None and num_frames:
+                progress(count / num_frames)
+    finally:
+        if process is not None:
+            with instrumentation.span('encode_flush'):
+                frame_queue.put(_DONE)
+                writer.join()
+                process.stdin.close()
+                stderr = process.stderr.read().decode(errors='replace')
+                process.wait()
+    if process is not None and (errors or process.returncode != 0):
+        raise IOError(f"ffmpeg failed writing {filename}: {stderr.strip() or errors}")
+    if process is not None:
+        instrumentation.count('bytes_encoded', os.path.getsize(filename))
+    return count
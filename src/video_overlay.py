@@ -1,36 +1,31 @@
 # video_cropper.py
 import streamlit as st
-import moviepy.editor as mp
 import os
-from . import video_utils
+from . import video_utils, video_probe, gpx_utils, gpx_gauges, instrumentation, render_jobs, upload_store
 
 
 def video_overlay():
     st.header("GPX Video Overlay")
+    profiler = instrumentation.streamlit_profiler('video_overlay_profiler')
 
     if 'gpx_animation_path' not in st.session_state:
-        uploaded_gpx = st.file_uploader("Upload a GPX Animation", type=["mp4","mov"])
+        uploaded_gpx = st.file_uploader("Upload a GPX Animation", type=["mp4","mov","gif"])
         if uploaded_gpx is not None:
-            gpx_video_path = os.path.join("temp_gpx.mp4")
-            with open(gpx_video_path, "wb") as f:
-                f.write(uploaded_gpx.getbuffer())
-        
-            st.session_state.gpx_animation_path = gpx_video_path
+            st.session_state.gpx_animation_path = upload_store.streamlit_ingest(uploaded_gpx)
 
     if 'cropped_video_path' not in st.session_state:
         uploaded_video = st.file_uploader("Upload a Video", type=["mp4","mov"])
         if uploaded_video is not None:
-            video_path = os.path.join("temp_video.mp4")
-            #with open(video_path, "wb") as f:
-            #    f.write(uploaded_video.getbuffer())
+            st.session_state.cropped_video_path = upload_store.streamlit_ingest(uploaded_video)
+
+    if 'gpx_cropped_df' in st.session_state and 'cropped_video_path' in st.session_state:
+        direct_overlay(st.session_state.cropped_video_path, st.session_state.gpx_cropped_df, profiler)
 
-            st.session_state.cropped_video_path = video_path
-            
     if 'gpx_animation_path' in st.session_state and 'cropped_video_path' in st.session_state:
     
-        # Extract the first frame of the each
-        gpx_first_frame = video_utils.extract_first_frame(st.session_state.gpx_animation_path)
-        video_first_frame = video_utils.extract_first_frame(st.session_state.cropped_video_path)
+        # First frame of each, decoded once per file and cached across reruns
+        gpx_first_frame = video_probe.thumbnail(st.session_state.gpx_animation_path, with_alpha=True)
+        video_first_frame = video_probe.thumbnail(st.session_state.cropped_video_path)
 
         st.image(gpx_first_frame, caption="GPX")
         st.image(video_first_frame, caption="Video")
@@ -42,21 +37,61 @@ def video_overlay():
         transparency = st.slider("Overlay Transparency", min_value=0.0, max_value=1.0, value=1.0)
         add_gray_box = st.checkbox("Put GPX in coloured box")
         invert_colors = st.checkbox("Invert colours")
+        workers = st.number_input("Compositing Workers", min_value=1, value=1,
+                                  help="Composite and encode time segments of the video in parallel")
 
-        video_utils.overlay_videos(st.session_state.cropped_video_path, 
-                                    st.session_state.gpx_animation_path, 
-                                    position, "previewed_video.mp4", 
-                                    overlay_height, overlay_width, transparency,
-                                    add_gray_box, invert_colors, preview=True)
+        # Preview a single composited frame in memory, no encode
+        base_duration = video_probe.probe(st.session_state.cropped_video_path)['duration']
+        preview_time = st.slider("Preview Time", min_value=0.0, max_value=float(base_duration), value=0.0,
+                                 format="%.1f seconds")
+        preview_frame = video_utils.preview_overlay(st.session_state.cropped_video_path,
+                                                    st.session_state.gpx_animation_path, preview_time,
+                                                    position, overlay_height, overlay_width, transparency,
+                                                    add_gray_box, invert_colors)
+        st.image(preview_frame, caption="Overlay Preview")
 
         if st.button("Overlay Videos"):
-            output_path = "overlayed_video.mp4"
-            video_utils.overlay_videos(st.session_state.cropped_video_path, 
-                                       st.session_state.gpx_animation_path, 
-                                       position, output_path, 
-                                       overlay_height, overlay_width, transparency,
-                                       add_gray_box, invert_colors, preview=False)
+            st.session_state.overlay_job = render_jobs.submit(
+                'Video overlay', video_utils.cached_overlay_videos, st.session_state.cropped_video_path, 
+                st.session_state.gpx_animation_path, position, overlay_height, overlay_width,
+                transparency, add_gray_box, invert_colors, workers=workers, profiler=profiler,
+                profile_path=instrumentation.profile_path('overlay_videos', profiler,
+                                                          render_jobs.streamlit_session_dir()))
+
+        job = st.session_state.get('overlay_job')
+        if job is not None and render_jobs.streamlit_job(job, 'overlay_job'):
+            output_path = job.result()
             st.success("Videos overlayed successfully!")
             st.video(output_path)
             with open(output_path, "rb") as f:
-                st.download_button("Download Complete Video", f, output_path)
\ No newline at end of file
+                st.download_button("Download Complete Video", f, os.path.basename(output_path))
+
+def direct_overlay(video_path, gpx_df, profiler=None):
+    st.subheader("Render GPX Directly Into Video")
+    st.write("Draws the GPX overlay while compositing, without creating an animation file first.")
+
+    overlay = st.selectbox("Direct Overlay", ["map", "compass", *gpx_gauges.GAUGES])
+    position = st.selectbox("Direct Overlay Position", ["Top-Left", "Top-Right", "Bottom-Left", "Bottom-Right"], index=3)
+    overlay_width = st.slider("Direct Overlay Width", min_value=50, max_value=5000, value=500)
+    overlay_height = st.slider("Direct Overlay Height", min_value=50, max_value=5000, value=300)
+    transparency = st.slider("Direct Overlay Transparency", min_value=0.0, max_value=1.0, value=1.0)
+    add_gray_box = st.checkbox("Put direct GPX in coloured box")
+    invert_colors = st.checkbox("Invert direct colours")
+
+    if st.button("Render And Overlay"):
+        st.session_state.direct_overlay_job = render_jobs.submit(
+            'Direct overlay', gpx_utils.gpx_overlay_video, video_path, gpx_df,
+            render_jobs.streamlit_session_path("overlayed_video.mp4"), (overlay_width, overlay_height),
+            overlay=overlay, position=position, transparency=transparency, add_gray_box=add_gray_box,
+            invert_colors=invert_colors, style=st.session_state.get('gpx_animation_options', {}),
+            profiler=profiler,
+            profile_path=instrumentation.profile_path('overlay_gpx_direct', profiler,
+                                                      render_jobs.streamlit_session_dir()))
+
+    job = st.session_state.get('direct_overlay_job')
+    if job is not None and render_jobs.streamlit_job(job, 'direct_overlay_job'):
+        output_path = job.result()
+        st.success("Videos overlayed successfully!")
+        st.video(output_path)
+        with open(output_path, "rb") as f:
+            st.download_button("Download Complete Video", f, os.path.basename(output_path))
@@ -0,0 +1,154 @@
+"""
+Container metadata, keyframe positions and thumbnails of videos.
+
+``probe`` reads everything the pages and the pipeline need to know about a
+video (duration, frame rate, size, rotation, codecs) from a single
+``ffmpeg -i`` call, which only parses the container headers. Keyframe
+positions come from a stream copy into ffmpeg's packet listing, which reads
+the packets but decodes none of them. Thumbnails seek to the nearest keyframe
+and decode a single frame at reduced size.
+
+Results are cached in memory, keyed by ``render_cache.file_fingerprint``
+(path, size and modification time), so reruns and other sessions looking at
+the same upload never reopen the file, while a rewritten file is probed again.
+"""
+import re
+import subprocess
+from functools import lru_cache
+
+import numpy as np
+
+from . import video_encoder, render_cache, instrumentation
+
+THUMBNAIL_WIDTH = 640
+ALPHA_PIXEL_FORMATS = ('argb', 'rgba', 'bgra', 'abgr', 'pal8')
+_NO_PTS = -2**63  # AV_NOPTS_VALUE
+
+
+def _seconds(hours, minutes, seconds) -> float:
+    return 3600 * int(hours) + 60 * int(minutes) + float(seconds)
+
+
+def parse_info(text: str) -> dict:
+    """
+    Metadata from the stream listing ``ffmpeg -i`` prints, under the keys of
+    moviepy's ``ffmpeg_parse_infos`` plus codec, pixel format and rotation.
+    """
+    info = {'duration': 0.0, 'bitrate': None, 'video_found': False, 'audio_found': False}
+    duration = re.search(r'Duration: (\d+):(\d+):([\d.]+)', text)
+    if duration:
+        info['duration'] = _seconds(*duration.groups())
+    bitrate = re.search(r'bitrate: (\d+) kb/s', text)
+    if bitrate:
+        info['bitrate'] = int(bitrate.group(1))
+
+    # Only the first video stream and the metadata lines below it, up to the next stream
+    video = re.search(r'Stream #0:\d+.*?: Video: (.*)((?:\n(?!\s*Stream #).*)*)', text)
+    if video:
+        line, details = video.groups()
+        size = re.search(r' (\d+)x(\d+)[,\s]', line)
+        fps = re.search(r'([\d.]+) fps', line) or re.search(r'([\d.]+) tbr', line)
+        rotation = (re.search(r'displaymatrix: rotation of (-?[\d.]+) degrees', details)
+                    or re.search(r'rotate\s*:\s*(-?[\d.]+)', details))
+        info['video_found'] = True
+        info['video_codec'] = re.match(r'(\w+)', line).group(1)
+        pix_fmt = re.match(r'[^,]*, (\w+)', line)
+        info['pix_fmt'] = pix_fmt.group(1) if pix_fmt else None
+        info['video_size'] = [int(size.group(1)), int(size.group(2))] if size else None
+        info['video_fps'] = float(fps.group(1)) if fps else None
+        info['video_rotation'] = round(float(rotation.group(1))) % 360 if rotation else 0
+        # Decoders apply the rotation, so frames come out in the displayed orientation
+        info['display_size'] = (info['video_size'][::-1] if info['video_size'] and info['video_rotation'] % 180
+                                else info['video_size'])
+        info['video_duration'] = info['duration']
+        info['video_nframes'] = int(info['duration'] * info['video_fps']) + 1 if info['video_fps'] else None
+
+    audio = re.search(r'Stream #0:\d+.*?: Audio: .*?(\d+) Hz', text)
+    if audio:
+        info['audio_found'] = True
+        info['audio_fps'] = int(audio.group(1))
+    return info
+
+
+@lru_cache(maxsize=64)
+def _probe(path: str, fingerprint: tuple) -> dict:
+    with instrumentation.span('probe'):
+        # Without an output file ffmpeg only lists the streams and exits
+        result = subprocess.run([video_encoder.ffmpeg_binary(), '-hide_banner', '-i', path], capture_output=True)
+    text = result.stderr.decode(errors='replace')
+    if 'Input #0' not in text:
+        raise IOError(f"ffmpeg could not read {path}: {text.strip()}")
+    return parse_info(text)
+
+
+def probe(path: str) -> dict:
+    """
+    Container metadata without decoding: ``duration``, ``video_fps``,
+    ``video_size`` (as stored) and ``display_size`` (after ``video_rotation``),
+    ``video_nframes``, ``video_codec``, ``pix_fmt``, ``bitrate`` and audio.
+    The returned dict is shared between callers and must not be modified.
+    """
+    return _probe(path, render_cache.file_fingerprint(path))
+
+
+def has_alpha(path: str) -> bool:
+    """Whether the first video stream stores transparency (QuickTime RLE, PNG, GIF, ...)."""
+    pix_fmt = probe(path).get('pix_fmt') or ''
+    return pix_fmt in ALPHA_PIXEL_FORMATS or pix_fmt.startswith(('yuva', 'gbrap', 'ya'))
+
+
+@lru_cache(maxsize=32)
+def _keyframe_times(path: str, fingerprint: tuple) -> np.ndarray:
+    # framecrc lists every packet with its pts; only packets that are not plain keyframes carry F=<flags>
+    command = [video_encoder.ffmpeg_binary(), '-hide_banner', '-loglevel', 'error', '-i', path,
+               '-map', '0:v:0', '-c', 'copy', '-f', 'framecrc', '-']
+    with instrumentation.span('keyframe_scan'):
+        result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        raise IOError(f"ffmpeg could not read keyframes of {path}: {result.stderr.decode(errors='replace').strip()}")
+    listing = result.stdout.decode(errors='replace')
+    numerator, denominator = re.search(r'#tb 0: (\d+)/(\d+)', listing).groups()
+    pts = [int(line.split(',')[2]) for line in listing.splitlines()
+           if line and not line.startswith('#') and 'F=' not in line]
+    pts = np.array([value for value in pts if value != _NO_PTS], dtype=np.int64)
+    times = np.unique(pts * int(numerator) / int(denominator))
+    times.flags.writeable = False
+    return times
+
+
+def keyframe_times(path: str) -> np.ndarray:
+    """Presentation times (seconds) of the keyframes of the first video stream."""
+    return _keyframe_times(path, render_cache.file_fingerprint(path))
+
+
+def decode_frame(path: str, t: float, size: tuple, with_alpha: bool = False) -> np.ndarray:
+    """
+    The frame shown at ``t`` seconds, scaled to ``size`` (w, h), from one
+    seeking ffmpeg call; None past the end of the video. Not cached.
+    """
+    width, height = size
+    pix_fmt, channels = ('rgba', 4) if with_alpha else ('rgb24', 3)
+    command = [video_encoder.ffmpeg_binary(), '-loglevel', 'error', '-ss', f'{t:.3f}', '-i', path,
+               '-frames:v', '1', '-vf', f'scale={width}:{height}',
+               '-f', 'rawvideo', '-pix_fmt', pix_fmt, '-']
+    with instrumentation.span('decode_frame'):
+        data = subprocess.run(command, capture_output=True).stdout
+    if len(data) < width * height * channels:
+        return None
+    return np.frombuffer(data, dtype=np.uint8, count=width * height * channels).reshape(height, width, channels)
+
+
+@lru_cache(maxsize=128)
+def _thumbnail(path: str, fingerprint: tuple, t: float, width: int, with_alpha: bool):
+    display_width, display_height = probe(path)['display_size']
+    width = min(width, display_width)
+    height = max(2, round(display_height * width / display_width / 2) * 2)
+    return decode_frame(path, t, (width, height), with_alpha)
+
+
+def thumbnail(path: str, t: float = 0, width: int = THUMBNAIL_WIDTH, with_alpha: bool = False) -> np.ndarray:
+    """
+    Read-only frame at ``t`` seconds, at most ``width`` pixels wide, for
+    previews. Cached per file version, time, width and alpha; None past the end.
+    """
+    return _thumbnail(path, render_cache.file_fingerprint(path), round(t, 3), width, with_alpha)
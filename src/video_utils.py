@@ -1,18 +1,233 @@
-import streamlit as st
 import moviepy.editor as mp
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
 import os
+import shutil
+import subprocess
+import tempfile
+from functools import lru_cache
+import numpy as np
 from PIL import Image, ImageEnhance, ImageOps
+from . import video_encoder, video_probe, render_pool, render_cache, instrumentation
 
-def crop_video(video_path: str, start_time: int, end_time: int, output_path: str) -> float:
+# moviepy 1.x resizes clips with Image.ANTIALIAS, which Pillow 10 removed
+if not hasattr(Image, 'ANTIALIAS'):
+    Image.ANTIALIAS = Image.LANCZOS
+
+GRAY_BOX_COLOR = (128, 128, 128)
+# Encoder for the re-encoded head and tail of a stream-copied crop, and the bitstream
+# filters that repeat each piece's codec parameters in-band, by source codec
+HEAD_ENCODERS = {
+    'h264': ('libx264', 'h264_mp4toannexb,dump_extra=freq=keyframe'),
+    'hevc': ('libx265', 'hevc_mp4toannexb,dump_extra=freq=keyframe'),
+}
+
+def moviepy_logger(progress, text: str):
+    """
+    moviepy ``logger`` reporting the frames written to a ``progress(text)``
+    callback factory; moviepy's own progress bar when ``progress`` is None.
+    """
+    if progress is None:
+        return 'bar'
+    import proglog
+    callback = progress(text)
+
+    class ProgressLogger(proglog.ProgressBarLogger):
+        def bars_callback(self, bar, attr, value, old_value=None):
+            # 't' counts video frames; audio is written first under 'chunk'
+            if bar == 't' and attr == 'index' and self.bars[bar]['total']:
+                callback(min(value + 1, self.bars[bar]['total']) / self.bars[bar]['total'])
+
+    return ProgressLogger()
+
+
+def crop_video(video_path: str, start_time: int, end_time: int, output_path: str, progress=None) -> float:
     video = mp.VideoFileClip(video_path)
     cropped_video = video.subclip(start_time, end_time)
-    cropped_video.write_videofile(output_path, codec="libx264")
+    with instrumentation.span('crop_reencode'):
+        cropped_video.write_videofile(output_path, codec="libx264",
+                                      logger=moviepy_logger(progress, "Cropping video..."))
     return cropped_video.duration
 
+
+def keyframe_times(video_path: str) -> np.ndarray:
+    """Presentation times (seconds) of the keyframes of the first video stream."""
+    return video_probe.keyframe_times(video_path)
+
+def video_codec(video_path: str) -> str:
+    """ffmpeg name of the first video stream's codec, e.g. 'h264' or 'hevc'."""
+    return video_info(video_path)['video_codec']
+
+def pixel_format(video_path: str) -> str:
+    """ffmpeg pixel format of the first video stream, e.g. 'yuv420p' or 'argb'."""
+    return video_info(video_path)['pix_fmt']
+
+def has_alpha(video_path: str) -> bool:
+    return video_probe.has_alpha(video_path)
+
+
+def _run_ffmpeg(args: list, output_path: str):
+    with instrumentation.span('ffmpeg'):
+        result = subprocess.run([video_encoder.ffmpeg_binary(), '-y', '-loglevel', 'error', *args, output_path],
+                                capture_output=True)
+    if result.returncode != 0:
+        raise IOError(f"ffmpeg failed writing {output_path}: {result.stderr.decode(errors='replace').strip()}")
+
+
+def crop_video_fast(video_path: str, start_time: float, end_time: float, output_path: str,
+                    exact_start: bool = False, progress=None) -> tuple:
+    """
+    Crop without re-encoding, using ffmpeg stream copy.
+
+    A stream copy can only start on a keyframe, so the start snaps back to the
+    keyframe at or before ``start_time``. The copy ends on a packet boundary,
+    which can be a few frames past ``end_time``; with B-frames the last of
+    them may skip the frames reordered after it.
+
+    With ``exact_start`` the crop is frame-exact at both ends instead: any
+    partial GOPs before the first and after the last keyframe inside the
+    range are re-encoded and joined to the stream-copied whole GOPs between
+    them (which must be closed GOPs, as cameras and x264 write them). Only the
+    first video and audio streams are kept (GoPro data tracks cannot be
+    muxed into mp4).
+
+    Returns the actual ``(start, end)`` of the cut in source seconds.
+    """
+    duration = video_info(video_path)['duration']
+    end_time = min(end_time, duration)
+    keyframes = keyframe_times(video_path)
+    fps = video_info(video_path)['video_fps']
+    half_frame = 0.5 / fps
+
+    earlier = keyframes[keyframes <= start_time + half_frame]
+    keyframe = earlier[-1] if len(earlier) else 0.0
+    streams = ['-map', '0:v:0', '-map', '0:a:0?']
+    if not exact_start:
+        # Seeking half a frame past the keyframe lands on it without rounding back a GOP
+        _run_ffmpeg(['-ss', f'{keyframe + half_frame:.6f}', '-i', video_path, '-t', f'{end_time - keyframe:.6f}',
+                     *streams, '-c', 'copy', '-avoid_negative_ts', 'make_zero'], output_path)
+        return float(keyframe), float(min(keyframe + video_info(output_path)['duration'], duration))
+
+    # Frame-exact cuts start and end on the frame grid
+    start_time, end_time = round(start_time * fps) / fps, round(end_time * fps) / fps
+    inside = keyframes[(keyframes >= start_time - half_frame) & (keyframes <= end_time + half_frame)]
+    codec = video_codec(video_path)
+    if codec not in HEAD_ENCODERS or not len(inside) or inside[0] >= end_time - half_frame:
+        # Nothing to stream copy; the whole range has to be re-encoded
+        return start_time, start_time + crop_video(video_path, start_time, end_time, output_path, progress)
+
+    # Head, copied GOPs and tail come from different encoders, so each piece
+    # carries its codec parameters in-band for decoders to switch over at the joins
+    encoder, filters = HEAD_ENCODERS[codec]
+    first_keyframe = inside[0]
+    to_end = end_time >= duration - half_frame
+    last_keyframe = duration if to_end else inside[-1]
+
+    def frames(start, stop):
+        return ['-frames:v', str(int(round((stop - start) * fps)))]
+
+    work_dir = tempfile.mkdtemp(prefix='crop_', dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        pieces = []
+        if first_keyframe > start_time + half_frame:
+            pieces.append(os.path.join(work_dir, 'head.mp4'))
+            _run_ffmpeg(['-ss', f'{start_time:.6f}', '-i', video_path, *frames(start_time, first_keyframe),
+                         '-map', '0:v:0', '-c:v', encoder, '-crf', '18', '-bsf:v', filters], pieces[-1])
+        if last_keyframe > first_keyframe + half_frame:
+            # Whole GOPs, counted in packets so the copy stops right before the last keyframe
+            pieces.append(os.path.join(work_dir, 'copy.mp4'))
+            _run_ffmpeg(['-ss', f'{first_keyframe + half_frame:.6f}', '-i', video_path,
+                         *([] if to_end else frames(first_keyframe, last_keyframe)),
+                         '-map', '0:v:0', '-c', 'copy', '-bsf:v', filters, '-avoid_negative_ts', 'make_zero'],
+                        pieces[-1])
+        if not to_end and end_time > last_keyframe + half_frame:
+            pieces.append(os.path.join(work_dir, 'tail.mp4'))
+            _run_ffmpeg(['-ss', f'{last_keyframe:.6f}', '-i', video_path, *frames(last_keyframe, end_time),
+                         '-map', '0:v:0', '-c:v', encoder, '-crf', '18', '-bsf:v', filters], pieces[-1])
+        joined = os.path.join(work_dir, 'joined.mp4')
+        render_pool.concat_videos(pieces, joined)
+        # Audio is cheap to encode, so it is cut frame-exact from the source in one go
+        _run_ffmpeg(['-i', joined, '-ss', f'{start_time:.6f}', '-t', f'{end_time - start_time:.6f}',
+                     '-i', video_path, '-map', '0:v:0', '-map', '1:a:0?', '-c:v', 'copy', '-c:a', 'aac'],
+                    output_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return start_time, float(min(start_time + video_info(output_path)['duration'], duration))
+
 def extract_first_frame(video_path: str) -> Image.fromarray:
-    video = mp.VideoFileClip(video_path)
-    first_frame = video.get_frame(0)
-    return Image.fromarray(first_frame)
+    return Image.fromarray(read_frame(video_path, 0))
+
+
+def video_info(video_path: str) -> dict:
+    """Container metadata (duration, video_size, video_fps, ...), see ``video_probe.probe``."""
+    return video_probe.probe(video_path)
+
+
+@lru_cache(maxsize=16)
+def _read_frame(video_path: str, fingerprint: tuple, t: float, size: tuple, with_alpha: bool):
+    return video_probe.decode_frame(video_path, t, size or video_info(video_path)['display_size'], with_alpha)
+
+def read_frame(video_path: str, t: float = 0, size: tuple = None, with_alpha: bool = False):
+    """
+    Decode the single frame shown at ``t`` seconds with one seeking ffmpeg call,
+    optionally scaled to ``size`` (w, h). Returns None past the end of the video.
+    Recent frames are cached, so repeated calls with the same arguments are free.
+    """
+    return _read_frame(video_path, render_cache.file_fingerprint(video_path), round(t, 3), size, with_alpha)
+
+
+def overlay_position(position: str, base_size: tuple, overlay_size: tuple) -> tuple:
+    (base_w, base_h), (overlay_w, overlay_h) = base_size, overlay_size
+    if position == "Top-Left":
+        return (0, 0)
+    elif position == "Top-Right":
+        return (base_w - overlay_w, 0)
+    elif position == "Bottom-Left":
+        return (0, base_h - overlay_h)
+    # Default to Bottom-Right
+    return (base_w - overlay_w, base_h - overlay_h)
+
+
+def composite_frame(base: np.ndarray, overlay: np.ndarray, pos: tuple, transparency: float,
+                    add_gray_box: bool, invert_colors: bool) -> np.ndarray:
+    """
+    Composite an RGB(A) ``overlay`` onto an RGB ``base`` frame at ``pos`` with
+    the same options as ``overlay_videos``. The base frame is not modified.
+    """
+    result = base.copy()
+    x, y = pos
+    overlay_h, overlay_w = overlay.shape[:2]
+    # Clip the overlay to the part that lies inside the base frame
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + overlay_w, base.shape[1]), min(y + overlay_h, base.shape[0])
+    if x1 <= x0 or y1 <= y0:
+        return result
+    region = result[y0:y1, x0:x1].astype(np.float32)
+    overlay = overlay[y0 - y:y1 - y, x0 - x:x1 - x]
+
+    if add_gray_box:
+        region[...] = GRAY_BOX_COLOR
+    rgb = overlay[:, :, :3].astype(np.float32)
+    if invert_colors:
+        rgb = 255 - rgb
+    alpha = transparency * (overlay[:, :, 3:4] / 255.0 if overlay.shape[2] == 4 else 1.0)
+    result[y0:y1, x0:x1] = (rgb * alpha + region * (1 - alpha) + 0.5).astype(np.uint8)
+    return result
+
+
+def preview_overlay(base_video_path: str, overlay_video_path: str, t: float, position: str,
+                    overlay_height: int, overlay_width: int, transparency: float,
+                    add_gray_box: bool, invert_colors: bool) -> Image.Image:
+    """Composite the frames at ``t`` in memory, without encoding anything."""
+    base = read_frame(base_video_path, t)
+    if base is None:
+        base = read_frame(base_video_path, 0)
+    overlay = read_frame(overlay_video_path, t, with_alpha=True)
+    if overlay is None:
+        return Image.fromarray(base)
+    # Resize in memory so size changes do not decode again
+    overlay = np.asarray(Image.fromarray(overlay).resize((overlay_width, overlay_height), Image.BILINEAR))
+    pos = overlay_position(position, (base.shape[1], base.shape[0]), (overlay_width, overlay_height))
+    return Image.fromarray(composite_frame(base, overlay, pos, transparency, add_gray_box, invert_colors))
 
 
 def adjust_transparency(image: Image, transparency: float) -> Image:
@@ -22,11 +237,23 @@ def adjust_transparency(image: Image, transparency: float) -> Image:
     return image
 
 
-def overlay_videos(base_video_path: str, overlay_video_path: str, position: str, output_path: str,
-                   overlay_height: int, overlay_width: int, transparency: float, 
-                   add_gray_box: bool, invert_colors: bool, preview=False) -> None:
+def _timed_frames(name: str):
+    # moviepy filter that times producing each frame, to tell it apart from encoding in write_videofile
+    def timed(get_frame, t):
+        with instrumentation.span(name):
+            frame = get_frame(t)
+        instrumentation.count('frames_rendered')
+        return frame
+    return timed
+
+
+def _overlay_clip(base_video_path: str, overlay_video_path: str, position: str, overlay_height: int,
+                  overlay_width: int, transparency: float, add_gray_box: bool, invert_colors: bool,
+                  preview=False):
     main_video = mp.VideoFileClip(base_video_path)
-    overlay_video = mp.VideoFileClip(overlay_video_path).resize((overlay_width, overlay_height))
+    # Decoding the alpha channel lets the track show through transparent backgrounds
+    overlay_video = mp.VideoFileClip(overlay_video_path, has_mask=has_alpha(overlay_video_path))
+    overlay_video = overlay_video.resize((overlay_width, overlay_height))
 
     if preview:
         # select first 2 frames for preview
@@ -39,26 +266,148 @@ def overlay_videos(base_video_path: str, overlay_video_path: str, position: str,
         overlay_video = overlay_video.fx(mp.vfx.invert_colors)
 
     # Calculate position
-    if position == "Top-Left":
-        pos = (0, 0)
-    elif position == "Top-Right":
-        pos = (main_video.w - overlay_video.w, 0)
-    elif position == "Bottom-Left":
-        pos = (0, main_video.h - overlay_video.h)
-    elif position == "Bottom-Right":
-        pos = (main_video.w - overlay_video.w, main_video.h - overlay_video.h)
-    else:
-        pos = (main_video.w - overlay_video.w, main_video.h - overlay_video.h)  # Default to Bottom-Right
+    pos = overlay_position(position, (main_video.w, main_video.h), (overlay_video.w, overlay_video.h))
 
     if add_gray_box:
-        gray_box = mp.ColorClip(size=(overlay_width, overlay_height), color=(128, 128, 128)).set_duration(main_video.duration)
+        gray_box = mp.ColorClip(size=(overlay_width, overlay_height), color=GRAY_BOX_COLOR).set_duration(main_video.duration)
         gray_box = gray_box.set_position(pos)
-        final_video = mp.CompositeVideoClip([main_video, gray_box, overlay_video.set_position(pos)])
-    else:
-        final_video = mp.CompositeVideoClip([main_video, overlay_video.set_position(pos)])
+        return mp.CompositeVideoClip([main_video, gray_box, overlay_video.set_position(pos)])
+    return mp.CompositeVideoClip([main_video, overlay_video.set_position(pos)])
+
 
-    final_video.write_videofile(output_path, codec="libx264")
+def overlay_videos(base_video_path: str, overlay_video_path: str, position: str, output_path: str,
+                   overlay_height: int, overlay_width: int, transparency: float, 
+                   add_gray_box: bool, invert_colors: bool, preview=False, progress=None,
+                   workers: int = 1) -> None:
+    """
+    Composite the overlay animation onto the base video. ``workers > 1``
+    composites time segments in parallel (``overlay_videos_parallel``).
+    """
+    clip_args = (base_video_path, overlay_video_path, position, overlay_height, overlay_width,
+                 transparency, add_gray_box, invert_colors)
+    if workers > 1 and not preview:
+        overlay_videos_parallel(clip_args, output_path, workers, progress=progress)
+        return
+
+    final_video = _overlay_clip(*clip_args, preview=preview)
+    if instrumentation.active():
+        final_video = final_video.fl(_timed_frames('decode_composite'))
+    with instrumentation.span('write_videofile'):
+        final_video.write_videofile(output_path, codec="libx264",
+                                    logger=moviepy_logger(progress, "Overlaying videos..."))
 
     if preview:
+        import streamlit as st
         preview_frame = extract_first_frame(output_path)
-        st.image(preview_frame, caption="Overlay Preview")
\ No newline at end of file
+        st.image(preview_frame, caption="Overlay Preview")
+
+
+def _overlay_segment(clip_args: tuple, times: np.ndarray, segment_path: str, fps: float, instrument=False):
+    # Spans recorded here are returned to the parent, which merges them into its recorder
+    with instrumentation.record('segment') as recorder:
+        with instrumentation.span('clip_setup'):
+            final_video = _overlay_clip(*clip_args)
+        # The writer write_videofile uses, with its defaults, so segments encode like the serial path
+        with instrumentation.span('write_videofile'), \
+                FFMPEG_VideoWriter(segment_path, final_video.size, fps, codec="libx264") as writer:
+            for t in times:
+                with instrumentation.span('decode_composite'):
+                    frame = final_video.get_frame(t)
+                instrumentation.count('frames_rendered')
+                writer.write_frame(frame.astype('uint8'))
+        final_video.close()
+    return len(times), recorder.summary() if instrument else None
+
+
+def overlay_videos_parallel(clip_args: tuple, output_path: str, workers: int = None, progress=None) -> None:
+    """
+    ``overlay_videos`` split into time segments composited and encoded by a
+    pool of ``workers`` processes, each opening the videos itself.
+
+    Segments take consecutive runs of the frame times the serial path writes
+    (``np.arange(0, duration, 1 / fps)``), so the output has the same frames
+    and duration. They are joined with a concat stream copy, and the audio is
+    encoded once from the whole timeline exactly as ``write_videofile`` does
+    and muxed in without re-encoding. Only x264's rate control differs at
+    segment boundaries, each of which starts on a keyframe.
+    """
+    workers = workers or render_pool.default_workers()
+    final_video = _overlay_clip(*clip_args)
+    fps = final_video.fps
+    times = np.arange(0, final_video.duration, 1.0 / fps)
+    chunks = render_pool.frame_chunks(len(times), workers)
+    work_dir = tempfile.mkdtemp(prefix='segments_', dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        audio_path = None
+        if final_video.audio is not None:
+            audio_path = os.path.join(work_dir, 'audio.mp3')
+            with instrumentation.span('write_audio'):
+                # write_videofile's defaults: 44.1 kHz, 4 bytes per sample, MP3
+                final_video.audio.write_audiofile(audio_path, 44100, 4, 2000, 'libmp3lame', logger=None)
+        final_video.close()
+
+        segment_paths = [os.path.join(work_dir, f'{index:05d}.mp4') for index in range(len(chunks))]
+        # Cancelling the job (an exception from the callback) terminates the segment workers
+        render_pool.run_chunks(_overlay_segment, [(clip_args, times[start:stop], path, fps, instrumentation.active())
+                                                  for (start, stop), path in zip(chunks, segment_paths)],
+                               workers, len(times),
+                               progress=progress("Overlaying videos...") if progress is not None else None)
+
+        with instrumentation.span('concat'):
+            if audio_path is None:
+                render_pool.concat_videos(segment_paths, output_path)
+            else:
+                video_path = os.path.join(work_dir, 'video.mp4')
+                render_pool.concat_videos(segment_paths, video_path)
+                _run_ffmpeg(['-i', video_path, '-i', audio_path, '-map', '0:v:0', '-map', '1:a:0', '-c', 'copy'],
+                            output_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def cached_overlay_videos(base_video_path: str, overlay_video_path: str, position: str,
+                          overlay_height: int, overlay_width: int, transparency: float,
+                          add_gray_box: bool, invert_colors: bool, output_name: str = "overlayed_video.mp4",
+                          cache_dir: str = render_cache.CACHE_DIR,
+                          cache_max_bytes: int = render_cache.CACHE_MAX_BYTES, progress=None,
+                          workers: int = 1) -> str:
+    """``overlay_videos`` through the render cache; returns the path of the composited video."""
+    options = [position, overlay_height, overlay_width, transparency, add_gray_box, invert_colors]
+    key = render_cache.cache_key('overlay_videos', render_cache.file_fingerprint(base_video_path),
+                                 render_cache.file_fingerprint(overlay_video_path), options, output_name)
+    entry = render_cache.cached(
+        key, lambda directory: overlay_videos(base_video_path, overlay_video_path, position,
+                                              os.path.join(directory, output_name), overlay_height,
+                                              overlay_width, transparency, add_gray_box, invert_colors,
+                                              progress=progress, workers=workers),
+        cache_dir=cache_dir, max_bytes=cache_max_bytes)
+    return os.path.join(entry, output_name)
+
+def overlay_gpx_direct(base_video_path: str, renderer, output_path: str, position: str,
+                       transparency: float, add_gray_box: bool, invert_colors: bool, progress=None) -> None:
+    """
+    Composite GPX overlay frames rendered on demand onto the base video in a single pass.
+
+    ``renderer`` (see ``gpx_utils.gpx_overlay_renderer``) must produce frames at the
+    base video's fps and the final overlay size; each base frame at time t pulls
+    overlay frame round(t * fps), holding the last one once the track has ended.
+    """
+    main_video = mp.VideoFileClip(base_video_path)
+    pos = overlay_position(position, (main_video.w, main_video.h), (renderer.width, renderer.height))
+    last_frame = max(renderer.resampler.num_frames - 1, 0)
+
+    def composite(get_frame, t):
+        frame = min(int(round(t * main_video.fps)), last_frame)
+        with instrumentation.span('decode_frame'):
+            base = get_frame(t)
+        with instrumentation.span('render_frame'):
+            overlay = renderer.render(frame)
+        with instrumentation.span('composite'):
+            result = composite_frame(base, overlay, pos, transparency, add_gray_box, invert_colors)
+        instrumentation.count('frames_rendered')
+        return result
+
+    final_video = main_video.fl(composite)
+    with instrumentation.span('write_videofile'):
+        final_video.write_videofile(output_path, codec="libx264",
+                                    logger=moviepy_logger(progress, "Rendering overlay into video..."))
+    renderer.close()
@@ -0,0 +1,34 @@
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import synthetic_track
+from src import gpx_utils, render_jobs
+
+
+def wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+def test_cancel_stops_parallel_render(tmp_path):
+    # Long enough that its chunks would keep the workers busy for minutes
+    track = pd.DataFrame(synthetic_track(2000))
+    runner = render_jobs.JobRunner(max_renders=1)
+    try:
+        job = runner.submit('GPX animation', gpx_utils.gpx_animation, track, fps=30,
+                            filename=str(tmp_path / 'gpx_animation'), animation_style='Incremental Raster',
+                            render_workers=2)
+        assert wait_for(lambda: job.status() == 'running', 30)
+        time.sleep(3)  # let the chunk workers start rendering
+        assert not job.finished()
+
+        start = time.monotonic()
+        job.cancel()
+        assert wait_for(job.finished, 10)
+        assert time.monotonic() - start < 5
+        assert job.status() == 'cancelled'
+    finally:
+        runner.shutdown()